@@ -0,0 +1,253 @@
+"""
+Ingestion and export benchmarks for the DataLogger copies in the labs.
+
+Synthetic telemetry is generated in both wire formats the labs use:
+    - string messages, "TIME:<ms>,CH0:<value>,CH1:<value>,..." (Lab3 style)
+    - packed float32 packets, ARRAY_SIZE samples per channel back to back with
+      TIME in seconds first (Lab5/Lab7 Kalman style)
+at a configurable sample rate, channel count and number of samples. Each
+DataLogger entry point that exists in a lab's copy is timed in its own
+process, so peak RSS is per benchmark, and the results are printed as JSON:
+throughput, p50/p99 latency per call and peak RSS.
+
+Usage:
+    python benchmarks/data_logger_benchmark.py --labs Lab3 Lab5 Lab7 --samples 100000
+    python benchmarks/data_logger_benchmark.py --benchmarks process_string save_to_csv -o results.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import struct
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = ["process_string", "process_strings", "process_dict", "process_bytes",
+              "save_data", "save_to_csv", "query", "resample"]
+
+
+def load_data_logger(lab):
+    """
+    Imports the DataLogger class from docs/labs/<lab>/code/local.
+    """
+    sys.path.insert(0, os.path.join(ROOT, "docs", "labs", lab, "code", "local"))
+    from data_logger import DataLogger
+    return DataLogger
+
+
+def channel_names(channels):
+    return ["CH{}".format(i) for i in range(channels)]
+
+
+def string_messages(config):
+    """
+    Returns the synthetic telemetry as Lab3 style strings, one per sample.
+    """
+    rng = np.random.default_rng(config["seed"])
+    period_ms = 1000.0 / config["rate"]
+    times = (np.arange(config["samples"]) * period_ms).astype(np.int64)
+    values = np.cumsum(rng.normal(0, 0.1, (config["channels"], config["samples"])), axis=1)
+    names = channel_names(config["channels"])
+    rows = zip(times.tolist(), *[np.round(v, 4).tolist() for v in values])
+    return [",".join(["TIME:{}".format(row[0])] + ["{}:{}".format(n, v) for n, v in zip(names, row[1:])])
+            for row in rows]
+
+
+def packed_packets(config):
+    """
+    Returns the synthetic telemetry as Lab5/Lab7 style packets of float32 arrays.
+    """
+    rng = np.random.default_rng(config["seed"])
+    size = config["array_size"]
+    count = config["samples"] // size
+    times = (np.arange(count * size) / config["rate"]).astype(np.float32).reshape(count, 1, size)
+    values = np.cumsum(rng.normal(0, 0.1, (count, config["channels"], size)), axis=2).astype(np.float32)
+    frames = np.concatenate([times, values], axis=1).astype("<f4")
+    return [frame.tobytes() for frame in frames]
+
+
+def layout(config):
+    return [("TIME", "<f4", config["array_size"])] + [(n, "<f4", config["array_size"]) for n in channel_names(config["channels"])]
+
+
+def timed_calls(func, args_list):
+    """
+    Calls func once per entry of args_list and returns the per-call latencies.
+    """
+    latencies = np.empty(len(args_list))
+    for i, args in enumerate(args_list):
+        start = time.perf_counter()
+        func(*args)
+        latencies[i] = time.perf_counter() - start
+    return latencies
+
+
+def filled_logger(DataLogger, config):
+    """
+    Returns a logger holding the string telemetry, for the export benchmarks.
+    """
+    logger = DataLogger()
+    if hasattr(logger, "process_strings"):
+        logger.process_strings(string_messages(config))
+    else:
+        for message in string_messages(config):
+            logger.process_string(message)
+    return logger
+
+
+def run_benchmark(DataLogger, name, config):
+    """
+    Runs one benchmark and returns (latencies, samples processed), or None if
+    this copy of DataLogger does not have the method.
+    """
+    if not hasattr(DataLogger, name):
+        return None
+    logger = DataLogger()
+    names = ["TIME"] + channel_names(config["channels"])
+    size = config["array_size"]
+
+    if name == "process_string":
+        messages = string_messages(config)
+        return timed_calls(logger.process_string, [(m,) for m in messages]), len(messages)
+    if name == "process_strings":
+        messages = string_messages(config)
+        batch = config["batch"]
+        batches = [(messages[i:i + batch],) for i in range(0, len(messages), batch)]
+        return timed_calls(logger.process_strings, batches), len(messages)
+    if name == "process_dict":
+        fmt = "<%df" % (len(names) * size)
+
+        def process_packet(packet):
+            floats = struct.unpack(fmt, packet)
+            logger.process_dict({n: floats[i * size:(i + 1) * size] for i, n in enumerate(names)})
+        packets = packed_packets(config)
+        return timed_calls(process_packet, [(p,) for p in packets]), len(packets) * size
+    if name == "process_bytes":
+        logger.register_layout(layout(config))
+        packets = packed_packets(config)
+        return timed_calls(logger.process_bytes, [(p,) for p in packets]), len(packets) * size
+
+    logger = filled_logger(DataLogger, config)
+    if name == "save_data":
+        return timed_calls(logger.save_data, [("bench.pkl",)]), config["samples"]
+    if name == "save_to_csv":
+        return timed_calls(logger.save_to_csv, [("bench.csv",)]), config["samples"]
+    end = config["samples"] * 1000 // config["rate"]
+    windows = [(e - end // 100, e) for e in np.linspace(end // 100, end, 200).astype(int).tolist()]
+    if name == "query":
+        return timed_calls(lambda t0, t1: logger.query(names[1:], t0, t1), windows), config["samples"]
+    if name == "resample":
+        period = 1000.0 / config["rate"] * 10
+        return timed_calls(lambda: logger.resample(names[1:], period, "mean"), [()]), config["samples"]
+
+
+def measure(lab, name, config):
+    """
+    Runs one (lab, benchmark) pair in the current directory and returns its
+    result, or None if the lab's DataLogger lacks the entry point.
+    """
+    DataLogger = load_data_logger(lab)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            outcome = run_benchmark(DataLogger, name, config)
+    except Exception as e:
+        return {"lab": lab, "benchmark": name, "error": repr(e)}
+    if outcome is None:
+        return None
+    latencies, samples = outcome
+    total = float(latencies.sum())
+    peak_rss = None
+    if resource is not None:
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        scale = 1 if platform.system() == "Darwin" else 1024
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20
+    return {
+        "lab": lab,
+        "benchmark": name,
+        "calls": len(latencies),
+        "samples": samples,
+        "seconds": total,
+        "samples_per_second": samples / total if total else None,
+        "p50_latency_us": float(np.percentile(latencies, 50) * 1e6),
+        "p99_latency_us": float(np.percentile(latencies, 99) * 1e6),
+        "max_latency_us": float(latencies.max() * 1e6),
+        "peak_rss_mb": peak_rss,
+    }
+
+
+def worker(lab, name, config, results):
+    """
+    Runs one (lab, benchmark) pair in a scratch directory, which is removed
+    afterwards with the files the loggers saved into it, and reports the
+    result through a multiprocessing queue.
+    """
+    with tempfile.TemporaryDirectory(prefix="data_logger_bench_") as directory:
+        os.chdir(directory)
+        try:
+            results.put(measure(lab, name, config))
+        finally:
+            # Leave the directory so it can be removed (required on Windows)
+            os.chdir(ROOT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--labs", nargs="+", default=["Lab3", "Lab5", "Lab7"], help="Lab folders to benchmark")
+    parser.add_argument("--benchmarks", nargs="+", default=BENCHMARKS, choices=BENCHMARKS)
+    parser.add_argument("--samples", type=int, default=100_000, help="Samples per channel")
+    parser.add_argument("--channels", type=int, default=4, help="Sensor channels besides TIME")
+    parser.add_argument("--rate", type=int, default=100, help="Sample rate in Hz (sets the time stamps)")
+    parser.add_argument("--array-size", type=int, default=50, help="Samples per channel in a packed packet")
+    parser.add_argument("--batch", type=int, default=1000, help="Messages per process_strings call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    config = {
+        "samples": args.samples,
+        "channels": args.channels,
+        "rate": args.rate,
+        "array_size": args.array_size,
+        "batch": args.batch,
+        "seed": args.seed,
+    }
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for lab in args.labs:
+        for name in args.benchmarks:
+            queue = context.Queue()
+            process = context.Process(target=worker, args=(lab, name, config, queue))
+            process.start()
+            result = queue.get()
+            process.join()
+            if result is None:
+                continue
+            results.append(result)
+            if "error" in result:
+                print("{lab:>5} {benchmark:<16} failed: {error}".format(**result), file=sys.stderr)
+            else:
+                print("{lab:>5} {benchmark:<16} {samples_per_second:>14,.0f} samples/s  p99 {p99_latency_us:>12,.1f} us"
+                      .format(**result), file=sys.stderr)
+
+    report = json.dumps({"config": config, "python": platform.python_version(),
+                         "numpy": np.__version__, "results": results}, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+
+
+if __name__ == "__main__":
+    main()
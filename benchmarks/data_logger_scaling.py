@@ -0,0 +1,80 @@
+"""
+Measures the per-message cost of DataLogger.process_string as the log grows.
+
+The logger is pre-filled to each size through process_dict (so building a
+10M-sample log takes seconds instead of minutes), then a fixed number of new
+messages is timed with process_string. With the duplicate time stamp check
+running against an index instead of the whole time list, the cost per message
+should stay flat from 1k to 10M samples.
+
+Usage:
+    python benchmarks/data_logger_scaling.py [--lab Lab5] [--messages 2000]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+import numpy as np
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+SENSORS = ["PROX", "INTENSE", "RANGE"]
+
+
+def load_data_logger(lab):
+    """
+    Imports the DataLogger class from docs/labs/<lab>/code/local.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, os.path.join(root, "docs", "labs", lab, "code", "local"))
+    from data_logger import DataLogger
+    return DataLogger
+
+
+def time_per_message(DataLogger, size, messages):
+    """
+    Returns the mean process_string time (in microseconds) on a log that
+    already holds `size` samples per sensor.
+    """
+    logger = DataLogger()
+    times = np.arange(size, dtype=np.int64)
+    logger.process_dict({"TIME": times, **{s: np.random.rand(size) for s in SENSORS}})
+    lines = ["PROX:{},INTENSE:{},RANGE:{},TIME:{}".format(i % 255, i * 0.5, i * 0.25, size + i)
+             for i in range(messages + 1)]
+
+    # The first append after the bulk fill doubles the column capacity; that
+    # one-off copy is amortized over the next `size` appends, so keep it out
+    # of the timed window.
+    logger.process_string(lines.pop(0))
+
+    start = time.perf_counter()
+    for line in lines:
+        logger.process_string(line)
+    elapsed = time.perf_counter() - start
+
+    # Keep the destructor from writing files into the working directory
+    logger.columns.clear()
+    with contextlib.redirect_stdout(io.StringIO()):
+        del logger
+    return elapsed / messages * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lab", default="Lab5", help="Lab folder whose data_logger.py is measured")
+    parser.add_argument("--messages", type=int, default=2000, help="Messages timed at each log size")
+    parser.add_argument("--max-size", type=int, default=SIZES[-1], help="Largest log size to test")
+    args = parser.parse_args()
+
+    DataLogger = load_data_logger(args.lab)
+    print("{:>12}  {:>14}".format("samples", "us/message"))
+    for size in SIZES:
+        if size > args.max_size:
+            break
+        print("{:>12,}  {:>14.2f}".format(size, time_per_message(DataLogger, size, args.messages)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Per-packet decoding cost of the Lab5/Lab7 packed Kalman telemetry.
+
+Compares the ways udp_client_example has turned a datagram of 5 arrays of
+--array-size float32s into logged data:
+    - tuple: struct.unpack, five tuple slices and a dict for process_dict
+      (the original print_message)
+    - process_bytes: DataLogger.process_bytes with a registered layout
+    - ring_push: FrameDecoder.decode and PacketRing.push alone, i.e. the work
+      left on the receive thread
+    - ring: the same plus PacketRing.drain_to every --drain packets, i.e. the
+      total work including logging
+Every path decodes the same synthetic samples; the ring paths get them as
+frames with the 8 byte header, the others as the bare arrays. Results
+(throughput, p50/p99 latency per packet) are printed as JSON.
+
+Usage:
+    python benchmarks/packet_decode_benchmark.py --lab Lab5 --packets 20000
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import struct
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PATHS = ["tuple", "process_bytes", "ring_push", "ring"]
+
+
+def packets(count, array_size, seed):
+    """
+    Returns synthetic packets of 5 arrays laid out back to back, without a frame header.
+    """
+    rng = np.random.default_rng(seed)
+    times = (np.arange(count * array_size) / 1000).astype(np.float32).reshape(count, 1, array_size)
+    values = np.cumsum(rng.normal(0, 0.1, (count, 4, array_size)), axis=2).astype(np.float32)
+    return [frame.tobytes() for frame in np.concatenate([times, values], axis=1).astype("<f4")]
+
+
+def run_path(example, name, data, drain):
+    """
+    Decodes every packet of data along one path and returns the per-packet latencies.
+    """
+    logger = example.DataLogger()
+    names = example.CHANNELS
+    size = len(data[0]) // (4 * len(names))
+    latencies = np.empty(len(data))
+
+    if name == "tuple":
+        fmt = "<%df" % (len(names) * size)
+
+        def handle(packet, i):
+            floats = struct.unpack(fmt, packet)
+            logger.process_dict({n: floats[j * size:(j + 1) * size] for j, n in enumerate(names)})
+    elif name == "process_bytes":
+        logger.register_layout([(n, "<f4", size) for n in names])
+
+        def handle(packet, i):
+            logger.process_bytes(packet)
+    else:
+        from frame_decoder import HEADER, encode_frame
+        decoder = example.FrameDecoder()
+        decoder.register_schema(example.KALMAN_SCHEMA, names)
+        ring = example.PacketRing(names, size, capacity=max(drain, 1) * 2)
+        header = encode_frame(example.KALMAN_SCHEMA, np.zeros((len(names), size)))[:HEADER.size]
+        data = [header + packet for packet in data]
+
+        def handle(packet, i):
+            ring.push(decoder.decode(packet).values)
+            if name == "ring" and (i + 1) % drain == 0:
+                ring.drain_to(logger)
+
+    for i, packet in enumerate(data):
+        start = time.perf_counter()
+        handle(packet, i)
+        latencies[i] = time.perf_counter() - start
+    return latencies
+
+
+def run_paths(args):
+    """
+    Benchmarks every path in args.paths and returns their results.
+    """
+    import udp_client_example as example
+
+    data = packets(args.packets, args.array_size, args.seed)
+    results = []
+    for name in args.paths:
+        with contextlib.redirect_stdout(io.StringIO()):
+            latencies = run_path(example, name, data, args.drain)
+        total = float(latencies.sum())
+        results.append({
+            "path": name,
+            "packets": len(latencies),
+            "seconds": total,
+            "packets_per_second": len(latencies) / total,
+            "p50_latency_us": float(np.percentile(latencies, 50) * 1e6),
+            "p99_latency_us": float(np.percentile(latencies, 99) * 1e6),
+            "max_latency_us": float(latencies.max() * 1e6),
+        })
+        print("{path:<14} {packets_per_second:>12,.0f} packets/s  p50 {p50_latency_us:>8,.1f} us  "
+              "p99 {p99_latency_us:>8,.1f} us".format(**results[-1]), file=sys.stderr)
+
+    # Let the example's logger save itself now, in the scratch directory,
+    # instead of at interpreter shutdown when it can no longer write files
+    with contextlib.redirect_stdout(io.StringIO()):
+        del example.data_logger
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lab", default="Lab5", help="Lab folder whose udp_client_example to benchmark")
+    parser.add_argument("--paths", nargs="+", default=PATHS, choices=PATHS)
+    parser.add_argument("--packets", type=int, default=20_000)
+    parser.add_argument("--array-size", type=int, default=50, help="Samples per channel in a packet")
+    parser.add_argument("--drain", type=int, default=20, help="Packets between drain_to calls on the ring path")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    sys.path.insert(0, os.path.join(ROOT, "docs", "labs", args.lab, "code", "local"))
+    # The example's DataLogger (and each path's) saves its data when it is
+    # collected, so run in a scratch directory that is removed afterwards
+    with tempfile.TemporaryDirectory(prefix="packet_decode_bench_") as scratch:
+        os.chdir(scratch)
+        try:
+            results = run_paths(args)
+        finally:
+            os.chdir(ROOT)
+
+    report = json.dumps({"lab": args.lab, "array_size": args.array_size, "drain": args.drain,
+                         "python": platform.python_version(), "numpy": np.__version__,
+                         "results": results}, indent=2)
+    print(report)
+    if output:
+        with open(output, "w") as f:
+            f.write(report + "\n")
+
+
+if __name__ == "__main__":
+    main()
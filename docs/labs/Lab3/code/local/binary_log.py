@@ -0,0 +1,710 @@
+import atexit
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+import numpy as np
+
+# File layout
+# -----------
+# The file starts with an 8 byte header:
+#     magic b"DLOG", format version (uint16), flags (uint16)
+# followed by any number of blocks, each holding up to block_size samples of a
+# single sensor:
+#     block header (16 bytes): magic b"BLK1", name length (uint16),
+#                              time dtype char, value dtype char,
+#                              sample count (uint32), reserved (uint32)
+#     sensor name (utf-8, zero padded to a multiple of 8 bytes)
+#     times  (count little-endian values, padded to 8 bytes)
+#     values (count little-endian values, padded to 8 bytes)
+# Every section starts on an 8 byte boundary so the arrays can be viewed
+# straight out of a memory map. Blocks are only ever appended; if the program
+# dies halfway through writing one, the reader ignores the truncated tail.
+#
+# Compressed blocks use the magic b"BLKZ" instead. Their reserved field holds
+# the payload length, and the payload (padded to 8 bytes) is the zlib
+# compressed times bytes followed by the values bytes. These blocks are
+# decompressed on read rather than viewed in place.
+#
+# Blocks with the magic b"BLKG" use the Gorilla style codec below, which
+# usually shrinks telemetry far more than zlib. Like b"BLKZ" blocks, the
+# reserved field holds the payload length. The payload is the byte length of
+# the times section (uint32), then the times section, then the values section.
+# A section is one codec byte followed by zlib compressed data: b"G" for the
+# Gorilla encoding of the array, or b"R" for its raw bytes when those
+# compress better (e.g. floats parsed from decimal strings, whose bit
+# patterns change almost completely from one value to the next).
+
+FILE_MAGIC = b"DLOG"
+FILE_VERSION = 1
+FILE_HEADER = struct.Struct("<4sHH")
+BLOCK_MAGIC = b"BLK1"
+ZLIB_BLOCK_MAGIC = b"BLKZ"
+GORILLA_BLOCK_MAGIC = b"BLKG"
+BLOCK_HEADER = struct.Struct("<4sHccII")
+COMPRESSED_MAGICS = {"zlib": ZLIB_BLOCK_MAGIC, "gorilla": GORILLA_BLOCK_MAGIC}
+
+
+def _padded(n):
+    """
+    Rounds a byte count up to the next multiple of 8.
+    """
+    return (n + 7) & ~7
+
+
+# Gorilla style codec
+# -------------------
+# Integer arrays (e.g. TIME in ms) are stored as delta-of-deltas, floats as
+# the XOR of each value's bit pattern with the previous one, as in Facebook's
+# Gorilla time series database. Evenly spaced time stamps then cost almost
+# nothing, and slowly varying values only store the few bits that changed.
+#
+# Gorilla interleaves variable-length control codes with the data, so it can
+# only be decoded one value at a time. Here the per-value fields are stored in
+# separate sections instead (2-bit control codes, then headers, then
+# payloads), so the field widths are known before the payloads are read and
+# both directions are vectorized with NumPy. Every field is written MSB first.
+#
+# Integer section: bit widths W1 <= W2 (uint8 each), the first value and the
+# first delta (int64 each), then for every further value a control code and
+# the zigzag encoded delta-of-delta:
+#     0 -> it is zero, 1 -> W1 bits, 2 -> W2 bits, 3 -> 64 bits.
+# Float section: a block window (leading zeros L and trailing zeros T, uint8
+# each) and the first value's bits, then for every further value a control
+# code for the XOR with the previous value:
+#     0 -> it is zero, 1 -> its meaningful bits fit the block window and are
+#     stored as B - L - T bits, 2 -> it carries a 12-bit header (leading zeros,
+#     meaningful length - 1) and then its meaningful bits.
+# W1, W2, L and T are the values that make the block smallest; they are found
+# from histograms of the value widths rather than by trying each candidate.
+# The encoded bytes are then zlib compressed, which squeezes out the long runs
+# of zero control codes that regular time stamps and constant values produce.
+
+GORILLA_WIDTHS = struct.Struct("<BB")
+GORILLA_HEADER_BITS = 12
+
+
+def _bit_length(x):
+    """
+    Number of significant bits of each value of a uint64 array (0 for 0).
+    """
+    high = (x >> np.uint64(32)).astype(np.float64)
+    low = (x & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    # frexp is exact for 32-bit integers: x = m * 2**e with 0.5 <= m < 1
+    return np.where(high > 0, 32 + np.frexp(high)[1], np.frexp(low)[1]).astype(np.int64)
+
+
+def _pack_fields(fields, widths):
+    """
+    Concatenates the low widths[i] bits of each fields[i] (uint64) into bytes.
+    """
+    used = widths > 0
+    fields, widths = fields[used], widths[used]
+    total = int(widths.sum())
+    if total == 0:
+        return b""
+    starts = np.cumsum(widths) - widths
+    owner = np.repeat(np.arange(len(widths)), widths)
+    shifts = (widths[owner] - 1 - (np.arange(total) - starts[owner])).astype(np.uint64)
+    bits = ((fields[owner] >> shifts) & np.uint64(1)).astype(np.uint8)
+    return np.packbits(bits).tobytes()
+
+
+def _unpack_fields(buffer, offset, widths):
+    """
+    Reads fields of the given bit widths packed by _pack_fields, starting at
+    byte `offset`. Returns (uint64 array of fields, offset after the fields).
+    """
+    total = int(widths.sum())
+    end = offset + (total + 7) // 8
+    fields = np.zeros(len(widths), dtype=np.uint64)
+    used = widths > 0
+    if total:
+        packed = np.frombuffer(buffer, np.uint8, end - offset, offset)
+        bits = np.unpackbits(packed, count=total).astype(np.uint64)
+        w = widths[used]
+        starts = np.cumsum(w) - w
+        owner = np.repeat(np.arange(len(w)), w)
+        shifts = (w[owner] - 1 - (np.arange(total) - starts[owner])).astype(np.uint64)
+        fields[used] = np.add.reduceat(bits << shifts, starts)
+    return fields, end
+
+
+def _suffix_sums(histogram):
+    """
+    2-D suffix sums: out[i, j] = histogram[i:, j:].sum().
+    """
+    return histogram[::-1, ::-1].cumsum(0).cumsum(1)[::-1, ::-1]
+
+
+def _encode_integers(values):
+    """
+    Encodes a 1-D integer array as delta-of-deltas (see above).
+    """
+    values = values.astype(np.int64)
+    n = len(values)
+    first = values[:1].tobytes() + np.diff(values[:2]).tobytes()
+    if n < 3:
+        return GORILLA_WIDTHS.pack(0, 0) + first
+    dod = np.diff(values, 2)
+    zigzag = ((dod << 1) ^ (dod >> 63)).view(np.uint64)
+    lengths = _bit_length(zigzag)
+    counts = np.bincount(lengths, minlength=65)
+    below = np.cumsum(counts)  # below[w]: values that fit in w bits
+    # Bits spent on non-zero values for every (W1, W2): W1 for those that
+    # fit in W1, W2 for those that fit in W2 but not W1, 64 for the rest.
+    w = np.arange(65)
+    nonzero = below - counts[0]
+    cost = (w[:, None] * nonzero[:, None] + w[None, :] * (below[None, :] - below[:, None])
+            + 64 * (n - 2 - below[None, :]))
+    cost[w[:, None] > w[None, :]] = np.iinfo(np.int64).max
+    cost[0, :] = np.iinfo(np.int64).max
+    w1, w2 = np.unravel_index(np.argmin(cost), cost.shape)
+    controls = np.where(lengths == 0, 0, np.where(lengths <= w1, 1, np.where(lengths <= w2, 2, 3)))
+    widths = np.array([0, w1, w2, 64])[controls]
+    return (GORILLA_WIDTHS.pack(w1, w2) + first
+            + _pack_fields(controls.astype(np.uint64), np.full(n - 2, 2))
+            + _pack_fields(zigzag, widths))
+
+
+def _decode_integers(buffer, offset, count, dtype):
+    """
+    Decodes `count` values written by _encode_integers at `offset`.
+    """
+    w1, w2 = GORILLA_WIDTHS.unpack_from(buffer, offset)
+    offset += GORILLA_WIDTHS.size
+    head = np.frombuffer(buffer, np.int64, min(count, 2), offset)
+    offset += 16
+    if count < 3:
+        return np.concatenate([head[:1], head[:1] + head[1:]]).astype(dtype)[:count]
+    controls, offset = _unpack_fields(buffer, offset, np.full(count - 2, 2))
+    widths = np.array([0, w1, w2, 64])[controls.astype(np.int64)]
+    zigzag, _ = _unpack_fields(buffer, offset, widths)
+    dod = (zigzag >> np.uint64(1)).view(np.int64) ^ -(zigzag & np.uint64(1)).view(np.int64)
+    deltas = np.concatenate([head[1:], head[1] + np.cumsum(dod)])
+    return (head[0] + np.concatenate([[0], np.cumsum(deltas)])).astype(dtype)
+
+
+def _encode_floats(values):
+    """
+    Encodes a 1-D float array as XORs of consecutive bit patterns (see above).
+    """
+    n = len(values)
+    bits = values.dtype.itemsize * 8
+    words = values.view("<u{}".format(values.dtype.itemsize)).astype(np.uint64)
+    first = values[:1].tobytes()
+    if n < 2:
+        return GORILLA_WIDTHS.pack(0, 0) + first
+    xor = words[1:] ^ words[:-1]
+    lengths = _bit_length(xor)
+    trailing = _bit_length(xor & (~xor + np.uint64(1))) - 1  # lowest set bit
+    nonzero = lengths > 0
+    lead = np.where(nonzero, bits - lengths, 0)
+    trail = np.where(nonzero, trailing, 0)
+    meaningful = np.where(nonzero, lengths - trail, 0)
+
+    # A value fits the window (L, T) if lead >= L and trail >= T. Choose the
+    # window that saves the most over giving every value its own header.
+    cell = lead[nonzero] * (bits + 1) + trail[nonzero]
+    shape = (bits + 1, bits + 1)
+    fits = np.bincount(cell, minlength=(bits + 1) ** 2).reshape(shape)
+    saved = np.bincount(cell, GORILLA_HEADER_BITS + meaningful[nonzero], (bits + 1) ** 2).reshape(shape)
+    window = np.arange(bits + 1)
+    size = bits - window[:, None] - window[None, :]
+    cost = np.where(size >= 1, _suffix_sums(fits) * size - _suffix_sums(saved), 0)
+    win_lead, win_trail = np.unravel_index(np.argmin(cost), cost.shape)
+    win_size = max(bits - win_lead - win_trail, 0)
+
+    in_window = nonzero & (lead >= win_lead) & (trail >= win_trail) & (win_size > 0)
+    new = nonzero & ~in_window
+    controls = np.where(in_window, 1, np.where(new, 2, 0))
+    headers = (lead[new] << 6) | (meaningful[new] - 1)
+    shifts = np.where(in_window, win_trail, trail).astype(np.uint64)
+    widths = np.where(in_window, win_size, np.where(new, meaningful, 0))
+    return (GORILLA_WIDTHS.pack(win_lead, win_trail) + first
+            + _pack_fields(controls.astype(np.uint64), np.full(n - 1, 2))
+            + _pack_fields(headers.astype(np.uint64), np.full(len(headers), GORILLA_HEADER_BITS))
+            + _pack_fields(xor >> shifts, widths))
+
+
+def _decode_floats(buffer, offset, count, dtype):
+    """
+    Decodes `count` values written by _encode_floats at `offset`.
+    """
+    bits = dtype.itemsize * 8
+    win_lead, win_trail = GORILLA_WIDTHS.unpack_from(buffer, offset)
+    offset += GORILLA_WIDTHS.size
+    word = np.dtype("<u{}".format(dtype.itemsize))
+    first = np.frombuffer(buffer, word, min(count, 1), offset).astype(np.uint64)
+    offset += dtype.itemsize
+    if count < 2:
+        return first.astype(word).view(dtype)
+    controls, offset = _unpack_fields(buffer, offset, np.full(count - 1, 2))
+    controls = controls.astype(np.int64)
+    new = controls == 2
+    headers, offset = _unpack_fields(buffer, offset, np.full(int(new.sum()), GORILLA_HEADER_BITS))
+    headers = headers.astype(np.int64)
+    meaningful = np.zeros(count - 1, dtype=np.int64)
+    shifts = np.zeros(count - 1, dtype=np.int64)
+    meaningful[new] = (headers & 63) + 1
+    shifts[new] = bits - (headers >> 6) - meaningful[new]
+    meaningful[controls == 1] = bits - win_lead - win_trail
+    shifts[controls == 1] = win_trail
+    payloads, _ = _unpack_fields(buffer, offset, meaningful)
+    xor = payloads << shifts.astype(np.uint64)
+    words = np.bitwise_xor.accumulate(np.concatenate([first, xor]))
+    return words.astype(word).view(dtype)
+
+
+def _gorilla_encode(values):
+    """
+    Encodes a 1-D array as a b"BLKG" section: the integer or float codec
+    (by dtype) or the raw bytes, whichever compresses smaller.
+    """
+    encoded = _encode_floats(values) if values.dtype.kind == 'f' else _encode_integers(values)
+    encoded = zlib.compress(encoded, 1)
+    raw = zlib.compress(values.tobytes(), 1)
+    if len(raw) < len(encoded):
+        return b"R" + raw
+    return b"G" + encoded
+
+
+def _gorilla_decode(section, count, dtype):
+    """
+    Decodes a section written by _gorilla_encode into an array of `count` values.
+    """
+    data = zlib.decompress(section[1:])
+    if section[:1] == b"R":
+        return np.frombuffer(data, dtype, count)
+    if dtype.kind == 'f':
+        return _decode_floats(data, 0, count, dtype)
+    return _decode_integers(data, 0, count, dtype)
+
+
+def _parse_block(buffer, offset):
+    """
+    Decodes the block starting at `offset` in a bytes-like buffer.
+
+    Returns (sensor, times, values, end_offset), or None if the block is
+    truncated or not a block. Raw blocks are returned as views into the buffer.
+    """
+    size = len(buffer)
+    if offset + BLOCK_HEADER.size > size:
+        return None
+    magic, name_len, time_char, value_char, count, payload_len = BLOCK_HEADER.unpack_from(buffer, offset)
+    if magic not in (BLOCK_MAGIC, ZLIB_BLOCK_MAGIC, GORILLA_BLOCK_MAGIC):
+        return None
+    time_dtype = np.dtype(time_char.decode()).newbyteorder("<")
+    value_dtype = np.dtype(value_char.decode()).newbyteorder("<")
+    name_start = offset + BLOCK_HEADER.size
+    payload_start = name_start + _padded(name_len)
+    times_size = count * time_dtype.itemsize
+    if magic == BLOCK_MAGIC:
+        values_start = payload_start + _padded(times_size)
+        end = values_start + _padded(count * value_dtype.itemsize)
+    else:
+        end = payload_start + _padded(payload_len)
+    if end > size:
+        return None
+    sensor = bytes(buffer[name_start:name_start + name_len]).decode("utf-8")
+    if magic == BLOCK_MAGIC:
+        times = np.frombuffer(buffer, time_dtype, count, payload_start)
+        values = np.frombuffer(buffer, value_dtype, count, values_start)
+    elif magic == ZLIB_BLOCK_MAGIC:
+        payload = zlib.decompress(bytes(buffer[payload_start:payload_start + payload_len]))
+        times = np.frombuffer(payload, time_dtype, count, 0)
+        values = np.frombuffer(payload, value_dtype, count, times_size)
+    else:
+        payload = bytes(buffer[payload_start:payload_start + payload_len])
+        times_len, = struct.unpack_from("<I", payload, 0)
+        times = _gorilla_decode(payload[4:4 + times_len], count, time_dtype)
+        values = _gorilla_decode(payload[4 + times_len:], count, value_dtype)
+    return sensor, times, values, end
+
+
+def _open_log(filename):
+    """
+    Memory maps a log file and checks its header. Returns the map, or None
+    for a file too short to hold any block.
+    """
+    if os.path.getsize(filename) < FILE_HEADER.size:
+        return None
+    raw = np.memmap(filename, dtype=np.uint8, mode="r")
+    magic, version, _ = FILE_HEADER.unpack_from(raw, 0)
+    if magic != FILE_MAGIC or version != FILE_VERSION:
+        raise ValueError("{} is not a version {} DataLogger log".format(filename, FILE_VERSION))
+    return raw
+
+
+def iter_blocks(filename):
+    """
+    Yields (sensor, times, values) for every block of a log in file order,
+    decoding one block at a time, so a compressed log can be loaded straight
+    into arrays without decoding it all up front. Stops quietly at a truncated
+    or corrupt block at the end of the file.
+    """
+    raw = _open_log(filename)
+    if raw is None:
+        return
+    offset = FILE_HEADER.size
+    while True:
+        parsed = _parse_block(raw, offset)
+        if parsed is None:
+            return
+        sensor, times, values, offset = parsed
+        yield sensor, times, values
+
+
+def read_block(filename, offset):
+    """
+    Reads the single block at `offset` of a log file (as returned by
+    BinaryLogWriter.write_block) and returns (sensor, times, values).
+    """
+    with open(filename, "rb") as f:
+        f.seek(offset)
+        header = f.read(BLOCK_HEADER.size)
+        _, name_len, time_char, value_char, count, payload_len = BLOCK_HEADER.unpack(header)
+        if header[:4] == BLOCK_MAGIC:
+            length = (_padded(count * np.dtype(time_char.decode()).itemsize)
+                      + _padded(count * np.dtype(value_char.decode()).itemsize))
+        else:
+            length = _padded(payload_len)
+        block = header + f.read(_padded(name_len) + length)
+    parsed = _parse_block(block, 0)
+    if parsed is None:
+        raise ValueError("No complete block at offset {} of {}".format(offset, filename))
+    return parsed[:3]
+
+
+class BinaryLogWriter:
+    """
+    Appends blocks of (time, value) samples to a binary log file.
+
+    Each call to write_block writes one self-contained block; after flush the
+    blocks written so far survive if the program crashes. Opening an existing
+    log appends to it.
+    """
+    def __init__(self, filename, block_size=4096, compress=False):
+        """
+        :param filename: Path of the log file to create or append to.
+        :param block_size: Number of samples a full block holds.
+        :param compress: False for raw blocks, True or "zlib" for zlib
+            compressed blocks, "gorilla" for the delta-of-delta/XOR codec
+            (typically an order of magnitude smaller for telemetry). Compressed
+            blocks cannot be memory mapped without decoding.
+        """
+        if compress is True:
+            compress = "zlib"
+        if compress and compress not in COMPRESSED_MAGICS:
+            raise ValueError("Unknown compression '{}'; expected one of {}".format(compress, tuple(COMPRESSED_MAGICS)))
+        self.filename = filename
+        self.block_size = block_size
+        self.compress = compress
+        new_file = not os.path.exists(filename) or os.path.getsize(filename) == 0
+        self.file = open(filename, "ab")
+        if new_file:
+            self.file.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, 0))
+            self.file.flush()
+
+    def write_block(self, sensor, times, values):
+        """
+        Writes one block holding the given samples of a sensor.
+
+        :param sensor: Sensor name.
+        :param times: 1-D array of time stamps.
+        :param values: 1-D array of sensor values, same length as times.
+        :return: File offset of the block, for read_block.
+        """
+        times = np.ascontiguousarray(times, dtype=times.dtype.newbyteorder("<"))
+        values = np.ascontiguousarray(values, dtype=values.dtype.newbyteorder("<"))
+        name = sensor.encode("utf-8")
+        if self.compress == "zlib":
+            sections = (name, zlib.compress(times.tobytes() + values.tobytes(), 1))
+            magic, payload_len = ZLIB_BLOCK_MAGIC, len(sections[1])
+        elif self.compress == "gorilla":
+            encoded_times = _gorilla_encode(times)
+            sections = (name, struct.pack("<I", len(encoded_times)) + encoded_times + _gorilla_encode(values))
+            magic, payload_len = GORILLA_BLOCK_MAGIC, len(sections[1])
+        else:
+            sections = (name, times.tobytes(), values.tobytes())
+            magic, payload_len = BLOCK_MAGIC, 0
+        offset = self.file.tell()
+        self.file.write(BLOCK_HEADER.pack(magic, len(name), times.dtype.char.encode(),
+                                          values.dtype.char.encode(), len(times), payload_len))
+        for section in sections:
+            self.file.write(section)
+            self.file.write(b"\0" * (_padded(len(section)) - len(section)))
+        return offset
+
+    def flush(self):
+        """
+        Pushes buffered blocks to the operating system.
+        """
+        if not self.file.closed:
+            self.file.flush()
+
+    def close(self):
+        """
+        Flushes and closes the log file.
+        """
+        if not self.file.closed:
+            self.file.flush()
+            self.file.close()
+
+
+class BinaryLogReader:
+    """
+    Opens a binary log read-only through numpy.memmap.
+
+    The file is mapped once and every raw block's times and values are NumPy
+    views into that mapping, so nothing is copied until you ask for it.
+    Compressed blocks are decompressed when the log is opened.
+    """
+    def __init__(self, filename):
+        """
+        :param filename: Path of the log file to open.
+        """
+        self.filename = filename
+        self.blocks = {}  # sensor -> list of (times, values) views, in file order
+        for sensor, times, values in iter_blocks(filename):
+            self.blocks.setdefault(sensor, []).append((times, values))
+
+    @property
+    def sensors(self):
+        """
+        Names of the sensors present in the log.
+        """
+        return list(self.blocks)
+
+    def read(self, sensor):
+        """
+        Returns (times, values) for one sensor. A sensor stored in a single
+        block is returned as memmap views; otherwise the blocks are concatenated.
+        """
+        blocks = self.blocks[sensor]
+        if len(blocks) == 1:
+            return blocks[0]
+        return (np.concatenate([times for times, _ in blocks]),
+                np.concatenate([values for _, values in blocks]))
+
+    def get_data(self):
+        """
+        Returns a dictionary mapping each sensor to (times, values), in the same
+        shape as DataLogger.get_data.
+        """
+        return {sensor: self.read(sensor) for sensor in self.blocks}
+
+
+def compact_log(filename, block_size=4096, compress=False):
+    """
+    Rewrites a log so every sensor is stored in full blocks of block_size
+    samples (the last one may be shorter), merging the many small blocks that
+    periodic checkpoints leave behind. Works one block at a time, so memory
+    stays bounded, and replaces the file atomically when done.
+
+    :param compress: Compression of the rewritten blocks, as for BinaryLogWriter.
+    """
+    reader = BinaryLogReader(filename)
+    temp = filename + ".compact"
+    writer = BinaryLogWriter(temp, block_size, compress)
+    try:
+        for sensor, blocks in reader.blocks.items():
+            pending = []
+            pending_size = 0
+            for times, values in blocks:
+                pending.append((times, values))
+                pending_size += len(times)
+                if pending_size < block_size:
+                    continue
+                times = np.concatenate([t for t, _ in pending])
+                values = np.concatenate([v for _, v in pending])
+                full = len(times) - len(times) % block_size
+                for start in range(0, full, block_size):
+                    writer.write_block(sensor, times[start:start + block_size], values[start:start + block_size])
+                pending = [(times[full:], values[full:])] if full < len(times) else []
+                pending_size = len(times) - full
+            if pending_size:
+                writer.write_block(sensor, np.concatenate([t for t, _ in pending]),
+                                   np.concatenate([v for _, v in pending]))
+    finally:
+        writer.close()
+    del reader
+    os.replace(temp, filename)
+
+
+class BackgroundWriter:
+    """
+    Writes blocks to BinaryLogWriters on a background thread.
+
+    Producers call submit, which only appends to a collections.deque (atomic in
+    CPython, no lock taken), so the thread that ingests data never waits for
+    the disk. The writer thread drains everything queued, writes it, flushes
+    the touched files once per batch and then runs the blocks' callbacks.
+
+    Every `interval` seconds the thread sets checkpoint_due, which the owner
+    polls to decide when to hand over its partial blocks too.
+
+    An exception raised by a write, flush or callback does not stop the
+    thread: it is counted in `errors` (see stats) and the thread carries on
+    with the other blocks. A block that could not be written is left out of
+    the file and its callback is not run.
+
+    The thread is a daemon; anything still queued is written when stop is
+    called or when the interpreter exits.
+    """
+    def __init__(self, interval=None, poll_interval=0.05):
+        """
+        :param interval: Seconds between checkpoint requests (None for never).
+        :param poll_interval: How long the thread sleeps when the queue is empty.
+        """
+        self.interval = interval
+        self.poll_interval = poll_interval
+        self.queue = deque()
+        self.checkpoint_due = False
+        self.max_queue_depth = 0
+        self.batches = 0
+        self.blocks_written = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self.total_flush_latency = 0.0
+        self.busy = False  # Set while blocks taken off the queue are being written
+        self.errors = 0
+        self.last_error = None
+        self._stopping = False
+        self._final = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def submit(self, log, sensor, times, values, on_written=None):
+        """
+        Queues one block for log.write_block. The arrays must not be modified
+        afterwards (pass copies). on_written(offset) is called on the writer
+        thread once the block has been written and flushed.
+        """
+        self.queue.append((log, sensor, times, values, on_written))
+        depth = len(self.queue)
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+
+    def _failed(self, error):
+        """
+        Records an exception raised on the writer thread.
+        """
+        self.errors += 1
+        self.last_error = repr(error)
+
+    def _drain(self):
+        """
+        Writes everything currently queued and flushes the files it touched.
+        """
+        start = time.perf_counter()
+        # Set before the first block leaves the queue, so wait never sees an
+        # empty queue while blocks are still being written
+        self.busy = True
+        try:
+            touched = set()
+            callbacks = []
+            while self.queue:
+                log, sensor, times, values, on_written = self.queue.popleft()
+                try:
+                    offset = log.write_block(sensor, times, values)
+                except Exception as e:
+                    self._failed(e)
+                    continue
+                touched.add(log)
+                self.blocks_written += 1
+                if on_written is not None:
+                    callbacks.append((on_written, offset))
+            for log in touched:
+                try:
+                    log.flush()
+                except Exception as e:
+                    self._failed(e)
+            for on_written, offset in callbacks:
+                try:
+                    on_written(offset)
+                except Exception as e:
+                    self._failed(e)
+            latency = time.perf_counter() - start
+            self.batches += 1
+            self.last_flush_latency = latency
+            self.max_flush_latency = max(self.max_flush_latency, latency)
+            self.total_flush_latency += latency
+        finally:
+            self.busy = False
+
+    def wait(self):
+        """
+        Blocks until every block submitted so far has been written and flushed
+        and its callback has run, or the thread has stopped.
+        """
+        while (self.queue or self.busy) and self.thread.is_alive():
+            time.sleep(self.poll_interval)
+
+    def _run(self):
+        next_checkpoint = time.monotonic() + self.interval if self.interval else None
+        while True:
+            if next_checkpoint is not None and time.monotonic() >= next_checkpoint:
+                self.checkpoint_due = True
+                next_checkpoint += self.interval
+            if self.queue:
+                self._drain()
+            elif self._stopping:
+                break
+            else:
+                time.sleep(self.poll_interval)
+        if self._final is not None:
+            try:
+                self._final()
+            except Exception as e:
+                self._failed(e)
+
+    def stop(self, final=None, wait=True):
+        """
+        Asks the thread to write what is queued, run final() and exit.
+        If the thread is no longer running, that work is done right here.
+        So is a later call's: once the writer has been stopped (e.g. by the
+        atexit hook), blocks queued afterwards are written and final() is run
+        by the caller, after the thread has finished.
+
+        :param final: Optional callable run after the last block is written
+            (e.g. closing and compacting the files).
+        :param wait: Block until the thread has finished.
+        """
+        if self._stopping:
+            if self.thread.is_alive():
+                self.thread.join()
+            if self.queue:
+                self._drain()
+            if final is not None:
+                final()
+            return
+        self._final = final
+        self._stopping = True
+        atexit.unregister(self.stop)
+        if not self.thread.is_alive():
+            if self.queue:
+                self._drain()
+            if final is not None:
+                final()
+        elif wait:
+            self.thread.join()
+
+    def stats(self):
+        """
+        Returns the current queue depth and flush latency metrics as a dict.
+        """
+        return {
+            "queue_depth": len(self.queue),
+            "max_queue_depth": self.max_queue_depth,
+            "batches": self.batches,
+            "blocks_written": self.blocks_written,
+            "last_flush_latency": self.last_flush_latency,
+            "max_flush_latency": self.max_flush_latency,
+            "mean_flush_latency": self.total_flush_latency / self.batches if self.batches else 0.0,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
@@ -1,14 +1,1183 @@
+import atexit
 import pickle
 import csv
+import os
+import re
+import weakref
+from collections import deque
+from functools import partial
+from heapq import heapify, heappop, heappush
+from itertools import count
+import numpy as np
+from binary_log import BinaryLogWriter, BackgroundWriter, compact_log, iter_blocks, read_block
+from downsample import lttb, minmax_decimate
+
+
+def _column_dtype(values, fixed=None):
+    """
+    Picks the storage dtype for a new column: int64 for integer data, float64
+    for anything else, unless a fixed dtype was requested.
+    """
+    if fixed is not None:
+        return np.dtype(fixed)
+    if values.dtype.kind in 'biu':
+        return np.dtype(np.int64)
+    return np.dtype(np.float64)
+
+
+_INT_PATTERN = r'[+-]?[0-9]+'
+_NUMBER_PATTERN = r'[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?'
+_INT_TEXT = re.compile(_INT_PATTERN)
+
+
+def _mixes_ints(values, array):
+    """
+    Returns True if a list or tuple of numbers holds ints as well as floats,
+    which np.asarray has turned into a float array.
+    """
+    if array.dtype.kind != 'f' or isinstance(values, np.ndarray):
+        return False
+    return any(isinstance(values[i], int) for i in np.flatnonzero(array == np.floor(array)).tolist())
+
+
+def _message_schema(s):
+    """
+    Returns the stripped keys of a "KEY:value, ..., TIME:t" message in order, or
+    None if the message is not well formed (missing colon, missing or repeated
+    TIME, repeated sensor). Values are not checked.
+    """
+    keys = []
+    for field in s.split(','):
+        if ':' not in field:
+            return None
+        keys.append(field.split(':', 1)[0].strip())
+    if len(set(keys)) != len(keys) or [key.upper() for key in keys].count("TIME") != 1:
+        return None
+    return tuple(keys)
+
+
+def _schema_regex(keys):
+    """
+    Compiles a regex that matches a message with exactly these keys in this
+    order and plain decimal values, capturing one value per key. TIME must be
+    an integer.
+    """
+    fields = []
+    for key in keys:
+        number = _INT_PATTERN if key.upper() == "TIME" else _NUMBER_PATTERN
+        fields.append(r'\s*{}\s*:\s*({})\s*'.format(re.escape(key), number))
+    return re.compile(','.join(fields))
+
+
+def _sorted_by_time(times, *arrays):
+    """
+    Returns times and the arrays that go with them (values, or None for a
+    missing mask) ordered by time. Already sorted columns are returned as they
+    are; otherwise a stable sort keeps equal time stamps in arrival order.
+    """
+    if len(times) < 2 or np.all(times[1:] >= times[:-1]):
+        return (times,) + arrays
+    order = np.argsort(times, kind='stable')
+    return (times[order],) + tuple(None if array is None else array[order] for array in arrays)
+
+
+def _format_cells(values, is_int=None):
+    """
+    Formats an array as CSV cells exactly like csv.writer formats Python
+    numbers (str of each value). Returns an object array of strings.
+
+    :param is_int: Optional boolean mask of the samples of a float array that
+        were logged as ints (see _Column), which are written without ".0".
+    """
+    cells = np.array(list(map(str, values.tolist())), dtype=object)
+    if is_int is not None and is_int.any():
+        cells[is_int] = list(map(str, values[is_int].astype(np.int64).tolist()))
+    return cells
+
+
+def _format_times(row_times, window, arrival_order):
+    """
+    Formats the TIME cells of a window. When integer and float time stamps are
+    mixed, each time is written the way the first sample logged at it was (e.g.
+    1001 rather than 1001.0), looking at the sensors in the order they were
+    first logged, like the original set-based export did.
+    """
+    if row_times.dtype.kind != 'f' or all(times.dtype.kind == 'f' and int_times is None
+                                          for times, _, int_times, _ in window):
+        return _format_cells(row_times)
+    is_int = np.zeros(len(row_times), dtype=bool)
+    decided = np.zeros(len(row_times), dtype=bool)
+    for i in arrival_order:
+        times, _, int_times, _ = window[i]
+        if times.dtype.kind != 'f':
+            int_times = np.ones(len(times), dtype=bool)
+        elif int_times is None:
+            int_times = np.zeros(len(times), dtype=bool)
+        idx = np.searchsorted(row_times, times)
+        # Repeats within a sorted column are adjacent; the first one counts
+        new = ~decided[idx]
+        new[1:] &= idx[1:] != idx[:-1]
+        is_int[idx[new]] = int_times[new]
+        decided[idx] = True
+    return _format_cells(row_times, is_int)
+
+
+def _csv_chunks(columns, chunk_rows, arrival_order):
+    """
+    Outer-joins time-sorted (times, values, int_times, int_values) columns on
+    time and yields the CSV text of the joined rows, one window at a time. The
+    int_* masks are None or mark the samples of a float array that were logged
+    as ints (see _Column).
+
+    Each window ends just before the earliest time that would give some column
+    more than chunk_rows samples, so no window holds more than chunk_rows samples
+    of any column. Only the window's cells are formatted, into one object
+    array per column, and the rows are joined from those columns.
+    When a column has several values for the same time, the last one wins.
+    arrival_order lists the column indices in the order the sensors were first
+    logged (see _format_times).
+    """
+    positions = [0] * len(columns)
+    while True:
+        end = None
+        for (times, *_), pos in zip(columns, positions):
+            if len(times) - pos > chunk_rows:
+                t = times[pos + chunk_rows]
+                end = t if end is None else min(end, t)
+
+        if end is None:
+            stops = [len(times) for times, *_ in columns]
+        else:
+            stops = [int(np.searchsorted(times, end, 'left')) for times, *_ in columns]
+            if stops == positions:
+                # More than chunk_rows samples share one time stamp
+                stops = [int(np.searchsorted(times, end, 'right')) for times, *_ in columns]
+
+        window = [tuple(None if array is None else array[pos:stop] for array in column)
+                  for column, pos, stop in zip(columns, positions, stops)]
+        # Sort and drop repeats by hand: np.unique imports numpy.ma lazily,
+        # which fails when __del__ exports at interpreter shutdown
+        row_times = np.sort(np.concatenate([times for times, *_ in window]))
+        if len(row_times) > 1:
+            row_times = row_times[np.concatenate(([True], row_times[1:] != row_times[:-1]))]
+        cell_columns = [_format_times(row_times, window, arrival_order)]
+        for times, values, _, int_values in window:
+            column = np.full(len(row_times), '', dtype=object)
+            column[np.searchsorted(row_times, times)] = _format_cells(values, int_values)
+            cell_columns.append(column)
+        if len(row_times):
+            yield '\r\n'.join(map(','.join, zip(*cell_columns))) + '\r\n'
+
+        if end is None:
+            return
+        positions = stops
+
+
+# Loggers with a log or spill file still open. They are closed at exit, before
+# the interpreter starts tearing modules down, since __del__ may run too late
+# to write anything (or not at all for a module level logger).
+_open_loggers = weakref.WeakSet()
+
+
+@atexit.register
+def _close_open_loggers():
+    for logger in list(_open_loggers):
+        logger.close()
+
+
+def _close_files(log, spill, compact):
+    """
+    Closes the binary log and spill file, compacting the log if asked to.
+    Runs on the background writer thread when there is one.
+    """
+    if log is not None:
+        log.close()
+        if compact and isinstance(log, BinaryLogWriter):
+            compact_log(log.filename, log.block_size, log.compress)
+    if spill is not None:
+        spill.close()
+
+
+def _resample_column(times, values, grid, period, method):
+    """
+    Resamples one time-sorted column onto a regular grid. Returns a float64
+    array (int64 for 'count') with NaN where the column has no data.
+    """
+    if method == 'linear':
+        if len(times) == 0:
+            return np.full(len(grid), np.nan)
+        return np.interp(grid, times, values, left=np.nan, right=np.nan)
+    if method == 'previous':
+        idx = np.searchsorted(times, grid, 'right') - 1
+        out = np.full(len(grid), np.nan)
+        valid = idx >= 0
+        out[valid] = values[idx[valid]]
+        return out
+
+    # Bucket aggregation: bucket i holds grid[i] <= time < grid[i] + period.
+    # Buckets are contiguous, so reduceat over the start of every non-empty
+    # bucket reduces exactly that bucket's samples.
+    starts = np.searchsorted(times, grid, 'left')
+    ends = np.searchsorted(times, grid + period, 'left')
+    counts = ends - starts
+    if method == 'count':
+        return counts
+    out = np.full(len(grid), np.nan)
+    filled = counts > 0
+    if not np.any(filled):
+        return out
+    if method == 'mean':
+        out[filled] = np.add.reduceat(values, starts[filled]) / counts[filled]
+    elif method == 'min':
+        out[filled] = np.minimum.reduceat(values, starts[filled])
+    elif method == 'max':
+        out[filled] = np.maximum.reduceat(values, starts[filled])
+    elif method == 'last':
+        out[filled] = values[ends[filled] - 1]
+    return out
+
+
+class _RunningStats:
+    """
+    Count, mean, variance, min and max of a stream of values, kept up to date
+    with the batch form of Welford's algorithm (Chan et al.): each batch is
+    summarized with NumPy and merged into the totals, so reading the
+    statistics is O(1) however many values were added.
+    """
 
-class DataLogger:
     def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # Sum of squared differences from the mean
+        self.min = None
+        self.max = None
+
+    def merge(self, count, mean, m2, lo, hi):
+        """
+        Adds the summary (count, mean, m2, min, max) of a batch of values.
+        """
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+        if self.min is None or lo < self.min:
+            self.min = lo
+        if self.max is None or hi > self.max:
+            self.max = hi
+
+    def remove(self, count, mean, m2):
+        """
+        Takes a previously merged batch summary back out (min and max are not
+        updated; _WindowStats tracks those separately).
+        """
+        total = self.count - count
+        if total <= 0:
+            self.count, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        new_mean = (self.count * self.mean - count * mean) / total
+        delta = mean - new_mean
+        self.m2 = max(self.m2 - m2 - delta * delta * total * count / self.count, 0.0)
+        self.mean = new_mean
+        self.count = total
+
+    def summary(self):
+        """
+        Returns the statistics as a dictionary. variance and std are the sample
+        (n - 1) estimates and are NaN for fewer than two values.
+        """
+        if self.count == 0:
+            return {"count": 0, "mean": float('nan'), "variance": float('nan'), "std": float('nan'),
+                    "min": None, "max": None}
+        variance = self.m2 / (self.count - 1) if self.count > 1 else float('nan')
+        return {"count": self.count, "mean": self.mean, "variance": variance,
+                "std": variance ** 0.5, "min": self.min, "max": self.max}
+
+
+def _batch_summary(values):
+    """
+    Returns (count, mean, m2, min, max) of a 1-D array, computed in float64.
+    """
+    x = values.astype(np.float64)
+    mean = float(np.add.reduce(x)) / len(x)
+    d = x - mean
+    return len(x), mean, float(d @ d), np.minimum.reduce(values).item(), np.maximum.reduce(values).item()
+
+
+class _WindowStats:
+    """
+    Running statistics over the samples whose time stamps lie within `window`
+    of the newest one.
+
+    Each append (a single sample or a whole batch) is kept as one summary in a
+    deque. When newer data arrives, summaries that fell out of the window are
+    popped from the left and subtracted from the running totals, and min/max
+    come from monotonic deques over the summaries, so every update and read is
+    amortized O(1). A batch leaves the window once its newest sample does.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.totals = _RunningStats()
+        self._entries = deque()  # (seq, last_time, count, mean, m2)
+        self._mins = deque()  # (seq, min), increasing
+        self._maxs = deque()  # (seq, max), decreasing
+        self._seq = 0
+        self._latest = None
+
+    def add(self, last_time, count, mean, m2, lo, hi):
+        """
+        Adds the summary of newly appended samples whose newest time stamp is
+        last_time, then expires what is now outside the window.
+        """
+        self._seq += 1
+        self._entries.append((self._seq, last_time, count, mean, m2))
+        self.totals.merge(count, mean, m2, lo, hi)
+        while self._mins and self._mins[-1][1] >= lo:
+            self._mins.pop()
+        self._mins.append((self._seq, lo))
+        while self._maxs and self._maxs[-1][1] <= hi:
+            self._maxs.pop()
+        self._maxs.append((self._seq, hi))
+        if self._latest is None or last_time > self._latest:
+            self._latest = last_time
+
+        start = self._latest - self.window
+        while self._entries and self._entries[0][1] <= start:
+            seq, _, count, mean, m2 = self._entries.popleft()
+            self.totals.remove(count, mean, m2)
+            while self._mins and self._mins[0][0] <= seq:
+                self._mins.popleft()
+            while self._maxs and self._maxs[0][0] <= seq:
+                self._maxs.popleft()
+
+    def summary(self):
+        """
+        Returns the window's statistics in the same format as _RunningStats.
+        """
+        result = self.totals.summary()
+        result["min"] = self._mins[0][1] if self._mins else None
+        result["max"] = self._maxs[0][1] if self._maxs else None
+        result["window"] = self.window
+        return result
+
+
+class _Rollup:
+    """
+    Fixed-period buckets (count, sum, min, max) of one sensor's values,
+    updated as samples arrive.
+
+    Bucket k covers k * period <= time < (k + 1) * period. The newest bucket is
+    kept open as a small Python list, so a single sample is added with a few
+    scalar operations; when a sample for a later bucket arrives the open one
+    is closed into a growable structured array. With max_buckets set, the
+    array holds up to 2 * max_buckets buckets and the oldest are dropped in
+    one step when it fills, like _Column in ring buffer mode. Samples for an
+    already closed bucket are merged into it while it is retained, and
+    counted in `dropped` otherwise.
+    """
+    BUCKET_DTYPE = np.dtype([("start", np.float64), ("count", np.int64), ("sum", np.float64),
+                             ("min", np.float64), ("max", np.float64)])
+    INITIAL_CAPACITY = 64
+
+    def __init__(self, period, max_buckets=None):
+        self.period = period
+        self.max_buckets = max_buckets
+        self.buckets = np.empty(2 * max_buckets if max_buckets else self.INITIAL_CAPACITY, dtype=self.BUCKET_DTYPE)
+        self.size = 0
+        self.open = None  # [start, count, sum, min, max] of the newest bucket
+        self.trimmed = False  # Whether old buckets have been dropped
+        self.dropped = 0
+
+    def add(self, t, v):
+        """
+        Adds a single sample.
+        """
+        self._add_bucket(t // self.period * self.period, 1, v, v, v)
+
+    def extend(self, times, values):
+        """
+        Adds a batch of samples, summarizing each bucket it touches with NumPy.
+        """
+        starts = times // self.period * self.period
+        if len(starts) > 1 and starts[0] == starts[-1] and np.all(starts == starts[0]):
+            self._add_bucket(starts[0].item(), len(values), float(np.add.reduce(values, dtype=np.float64)),
+                             np.minimum.reduce(values).item(), np.maximum.reduce(values).item())
+            return
+        order = np.argsort(starts, kind='stable')
+        starts, values = starts[order], values[order]
+        first = np.flatnonzero(np.concatenate([[True], starts[1:] != starts[:-1]]))
+        counts = np.diff(np.append(first, len(starts)))
+        sums = np.add.reduceat(values.astype(np.float64), first)
+        mins = np.minimum.reduceat(values, first)
+        maxs = np.maximum.reduceat(values, first)
+        for bucket in zip(starts[first].tolist(), counts.tolist(), sums.tolist(), mins.tolist(), maxs.tolist()):
+            self._add_bucket(*bucket)
+
+    def _add_bucket(self, start, count, total, lo, hi):
+        """
+        Merges the summary of some samples of bucket `start` into the rollup.
+        """
+        bucket = self.open
+        if bucket is not None and start == bucket[0]:
+            bucket[1] += count
+            bucket[2] += total
+            if lo < bucket[3]:
+                bucket[3] = lo
+            if hi > bucket[4]:
+                bucket[4] = hi
+        elif bucket is None or start > bucket[0]:
+            if bucket is not None:
+                self._close(bucket)
+            self.open = [start, count, total, lo, hi]
+        else:
+            self._merge_late(start, count, total, lo, hi)
+
+    def _make_room(self):
+        """
+        Makes room in the array for one more bucket, dropping the oldest
+        buckets when the retention limit is reached. Returns how many were
+        dropped.
+        """
+        if self.size < len(self.buckets):
+            return 0
+        if self.max_buckets:
+            keep = self.max_buckets - 1
+            drop = self.size - keep
+            self.buckets[:keep] = self.buckets[drop:self.size]
+            self.size = keep
+            self.trimmed = True
+            return drop
+        self.buckets = np.concatenate([self.buckets, np.empty(len(self.buckets), dtype=self.BUCKET_DTYPE)])
+        return 0
+
+    def _close(self, bucket):
+        """
+        Appends a finished bucket to the array, dropping the oldest buckets
+        when the retention limit is reached.
+        """
+        self._make_room()
+        self.buckets[self.size] = tuple(bucket)
+        self.size += 1
+
+    def _merge_late(self, start, count, total, lo, hi):
+        """
+        Merges late samples into an already closed bucket.
+        """
+        closed = self.buckets[:self.size]
+        i = int(np.searchsorted(closed["start"], start))
+        if i < self.size and closed["start"][i] == start:
+            closed["count"][i] += count
+            closed["sum"][i] += total
+            closed["min"][i] = min(closed["min"][i], lo)
+            closed["max"][i] = max(closed["max"][i], hi)
+        elif i > 0 or not self.trimmed:
+            # A bucket that had no samples yet: shift the newer ones up in place
+            drop = self._make_room()
+            i -= drop
+            if i < 0 or (i == 0 and drop):
+                # Older than every bucket left after making room
+                self.dropped += count
+                return
+            self.buckets[i + 1:self.size + 1] = self.buckets[i:self.size]
+            self.buckets[i] = (start, count, total, lo, hi)
+            self.size += 1
+        else:
+            self.dropped += count
+
+    def table(self, t0=None, t1=None):
+        """
+        Returns the retained buckets (including the open one) whose start is in
+        [t0, t1] as {"TIME": starts, "count": ..., "mean": ..., "min": ..., "max": ...}.
+        """
+        buckets = self.buckets[:self.size]
+        if self.open is not None:
+            buckets = np.append(buckets, np.array([tuple(self.open)], dtype=self.BUCKET_DTYPE))
+        start = 0 if t0 is None else int(np.searchsorted(buckets["start"], t0, 'left'))
+        stop = len(buckets) if t1 is None else int(np.searchsorted(buckets["start"], t1, 'right'))
+        buckets = buckets[start:stop]
+        return {"TIME": buckets["start"], "count": buckets["count"], "mean": buckets["sum"] / buckets["count"],
+                "min": buckets["min"], "max": buckets["max"]}
+
+
+class _ReorderBuffer:
+    """
+    Holds one sensor's newest samples in a heap until they are more than
+    `lateness` time units older than the newest time seen, then releases them
+    in time order, so samples that arrive slightly out of order (e.g. from
+    reordered UDP packets) are stored sorted.
+
+    Only samples within the lateness bound are held, so the heap stays small.
+    A sample older than the newest released one can no longer be put in order;
+    is_late reports it so the caller can discard it.
+    """
+
+    def __init__(self, lateness):
+        self.lateness = lateness
+        self.heap = []  # (time, arrival number, value)
+        self._arrivals = count()  # Keeps equal times in arrival order
+        self.max_time = None  # Newest time pushed
+        self.released = None  # Newest time released
+
+    def is_late(self, t):
+        """
+        Returns True if a sample at time t can no longer be stored in order.
+        """
+        return self.released is not None and t <= self.released
+
+    def contains(self, t):
+        """
+        Returns True if a sample at time t is waiting in the buffer.
+        """
+        return any(item[0] == t for item in self.heap)
+
+    def _release(self, watermark):
+        """
+        Pops every held sample with time <= watermark, in time order.
+        """
+        times, values = [], []
+        heap = self.heap
+        while heap and heap[0][0] <= watermark:
+            t, _, v = heappop(heap)
+            times.append(t)
+            values.append(v)
+        if times:
+            self.released = times[-1]
+        return times, values
+
+    def push(self, t, v):
+        """
+        Adds one sample. Returns the (times, values) lists released by it.
+        """
+        heappush(self.heap, (t, next(self._arrivals), v))
+        if self.max_time is None or t > self.max_time:
+            self.max_time = t
+        return self._release(self.max_time - self.lateness)
+
+    def push_many(self, times, values):
+        """
+        Adds a batch of samples (1-D arrays). Returns the (times, values)
+        released by it: array slices of an in-order batch pushed to an empty
+        buffer, otherwise lists like push, since held samples pushed one at a
+        time may be ints or floats.
+        """
+        newest = times.max().item()
+        if self.max_time is None or newest > self.max_time:
+            self.max_time = newest
+        watermark = self.max_time - self.lateness
+        if not self.heap and (len(times) == 1 or np.all(times[1:] > times[:-1])):
+            # In-order batch: release its head as array slices and keep the
+            # tail, which is sorted and so already a valid heap.
+            k = int(np.searchsorted(times, watermark, 'right'))
+            self.heap = list(zip(times[k:].tolist(), self._arrivals, values[k:].tolist()))
+            if k:
+                self.released = times[k - 1].item()
+            return times[:k], values[:k]
+        self.heap.extend(zip(times.tolist(), self._arrivals, values.tolist()))
+        heapify(self.heap)
+        return self._release(watermark)
+
+    def drain(self):
+        """
+        Releases every held sample.
+        """
+        if not self.heap:
+            return [], []
+        return self._release(max(item[0] for item in self.heap))
+
+
+class _Column:
+    """
+    One sensor's samples stored as a pair of growable typed NumPy arrays.
+
+    The arrays are over-allocated and their capacity doubles whenever it runs
+    out, so appending is amortized O(1). Times are stored as int64 (the
+    TIME:<ms> wire format) and values as int64 or float64 depending on what the
+    sensor sends. If a float later arrives in an integer column, that column is
+    promoted to float64, and from then on a boolean mask (int_times,
+    int_values) records which samples were logged as ints, so the CSV export
+    still writes them as "1" rather than "1.0". Passing value_dtype (e.g.
+    np.float32) fixes the value type instead.
+
+    The column also tracks the largest time stamp seen and whether the times are
+    still strictly increasing, so contains_time can answer without scanning:
+    in-order samples are O(1), out-of-order lookups fall back to a binary search
+    (sorted column) or a hash set that is built the first time the column stops
+    being sorted.
+
+    Running statistics of every value appended are folded in lazily: samples
+    added since the last read are summarized in one vectorized pass when the
+    statistics are read or before old samples are dropped, so each sample is
+    folded exactly once and ingestion pays nothing. Statistics over the most
+    recent stats_window time units need the append times, so when enabled they
+    are updated on every append. See DataLogger.stats.
+
+    Each (period, max_buckets) pair in rollups adds a _Rollup that is also
+    updated on every append; see DataLogger.rollup.
+    """
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self, value_dtype=None, capacity=None, stats_window=None, rollups=()):
+        self.value_dtype = value_dtype
+        self.capacity = capacity or self.INITIAL_CAPACITY
+        self.size = 0
+        self._times = None
+        self._values = None
+        self._int_times = None  # Which samples were ints, once the array is float
+        self._int_values = None
+        self._max_time = None
+        self._sorted = True
+        self._time_index = None
+        self._stats = _RunningStats()
+        self._folded = 0  # Number of stored samples already in _stats
+        self.window_stats = _WindowStats(stats_window) if stats_window is not None else None
+        self.rollups = {period: _Rollup(period, max_buckets) for period, max_buckets in rollups}
+
+    @property
+    def times(self):
+        """
+        View of the stored time stamps (no copy).
+        """
+        if self._times is None:
+            return np.empty(0, dtype=np.int64)
+        return self._times[:self.size]
+
+    @property
+    def values(self):
+        """
+        View of the stored sensor values (no copy).
+        """
+        if self._values is None:
+            return np.empty(0, dtype=_column_dtype(np.empty(0), self.value_dtype))
+        return self._values[:self.size]
+
+    @property
+    def int_times(self):
+        """
+        Mask of the time stamps that were logged as ints in a float64 time
+        array, or None if there are none.
+        """
+        return None if self._int_times is None else self._int_times[:self.size]
+
+    @property
+    def int_values(self):
+        """
+        Mask of the values that were logged as ints in a float64 value array,
+        or None if there are none.
+        """
+        return None if self._int_values is None else self._int_values[:self.size]
+
+    def _reserve(self, capacity):
+        """
+        Makes sure the arrays can hold at least `capacity` samples.
+        """
+        if capacity <= len(self._times):
+            return
+        new_capacity = len(self._times)
+        while new_capacity < capacity:
+            new_capacity *= 2
+        times = np.empty(new_capacity, dtype=self._times.dtype)
+        values = np.empty(new_capacity, dtype=self._values.dtype)
+        times[:self.size] = self._times[:self.size]
+        values[:self.size] = self._values[:self.size]
+        self._times = times
+        self._values = values
+        for name in ("_int_times", "_int_values"):
+            mask = getattr(self, name)
+            if mask is not None:
+                grown = np.empty(new_capacity, dtype=bool)
+                grown[:self.size] = mask[:self.size]
+                setattr(self, name, grown)
+
+    def contains_time(self, t):
+        """
+        Returns True if a sample with time stamp t is already stored.
+        """
+        if self.size == 0 or t > self._max_time:
+            return False
+        if self._sorted:
+            i = int(np.searchsorted(self._times[:self.size], t))
+            return i < self.size and self._times[i] == t
+        if self._time_index is None:
+            self._time_index = set(self.times.tolist())
+        return t in self._time_index
+
+    def _track_times(self, first, last, increasing, times):
+        """
+        Updates the high-water mark, sorted flag and hash index after an append.
+        """
+        if self._max_time is None:
+            self._max_time = last
+        else:
+            if first <= self._max_time:
+                self._sorted = False
+            self._max_time = max(self._max_time, last)
+        if not increasing:
+            self._sorted = False
+            self._max_time = max(self._max_time, times.max().item())
+        if self._time_index is not None:
+            self._time_index.update(times.tolist())
+
+    def _promote(self, time_kind, value_kind):
+        """
+        Switches integer arrays to float64 when floating point data arrives,
+        marking the samples already stored as ints.
+        """
+        if time_kind == 'f' and self._times.dtype.kind != 'f':
+            self._times = self._times.astype(np.float64)
+            self._int_times = np.ones(len(self._times), dtype=bool)
+        if self.value_dtype is None and value_kind == 'f' and self._values.dtype.kind != 'f':
+            self._values = self._values.astype(np.float64)
+            self._int_values = np.ones(len(self._values), dtype=bool)
+
+    def _mark_ints(self, start, stop, time_kind, value_kind):
+        """
+        Records whether samples [start, stop), just stored, were ints in the
+        arrays that are float64. The masks are only created once an int lands
+        in a float array, so float-only columns never have one.
+        """
+        if self._times.dtype.kind == 'f' and (self._int_times is not None or time_kind != 'f'):
+            if self._int_times is None:
+                self._int_times = np.zeros(len(self._times), dtype=bool)
+            self._int_times[start:stop] = time_kind != 'f'
+        if self.value_dtype is None and self._values.dtype.kind == 'f' and \
+                (self._int_values is not None or value_kind != 'f'):
+            if self._int_values is None:
+                self._int_values = np.zeros(len(self._values), dtype=bool)
+            self._int_values[start:stop] = value_kind != 'f'
+
+    def append(self, t, v):
+        """
+        Appends a single (time, value) sample.
+        """
+        if self._times is None:
+            self.extend(np.array([t]), np.array([v]))
+            return
+        time_kind = 'f' if isinstance(t, float) else 'i'
+        value_kind = 'f' if isinstance(v, float) else 'i'
+        self._promote(time_kind, value_kind)
+        if self.size == len(self._times):
+            self._reserve(self.size + 1)
+        self._times[self.size] = t
+        self._values[self.size] = v
+        self._mark_ints(self.size, self.size + 1, time_kind, value_kind)
+        self.size += 1
+        if t > self._max_time:
+            self._max_time = t
+        else:
+            self._sorted = False
+        if self._time_index is not None:
+            self._time_index.add(t)
+        if self.window_stats is not None:
+            self.window_stats.add(t, 1, float(v), 0.0, v, v)
+        for rollup in self.rollups.values():
+            rollup.add(t, v)
+
+    def stats(self):
+        """
+        Returns the running statistics of every value appended, including
+        dropped ones, after folding in the samples added since the last call
+        (O(k) for k new samples).
+        """
+        if self._folded < self.size:
+            self._stats.merge(*_batch_summary(self._values[self._folded:self.size]))
+            self._folded = self.size
+        return self._stats
+
+    def drop_oldest(self, n):
+        """
+        Removes the n oldest stored samples, keeping the arrays' capacity.
         """
-        Initializes an empty data dictionary.
+        self.stats()  # Fold the samples into the statistics before they go
+        keep = self.size - n
+        self._times[:keep] = self._times[n:self.size]
+        self._values[:keep] = self._values[n:self.size]
+        for mask in (self._int_times, self._int_values):
+            if mask is not None:
+                mask[:keep] = mask[n:self.size]
+        self.size = keep
+        self._folded = keep
+        self._time_index = None
+
+    def extend(self, times, values):
+        """
+        Appends a batch of samples with one vectorized copy per array.
+
+        times and values must be 1-D NumPy arrays of the same length.
+        """
+        n = len(times)
+        if self._times is None:
+            capacity = max(self.capacity, n)
+            self._times = np.empty(capacity, dtype=_column_dtype(times))
+            self._values = np.empty(capacity, dtype=_column_dtype(values, self.value_dtype))
+        else:
+            self._promote(times.dtype.kind, values.dtype.kind)
+        self._reserve(self.size + n)
+        self._times[self.size:self.size + n] = times
+        self._values[self.size:self.size + n] = values
+        self._mark_ints(self.size, self.size + n, times.dtype.kind, values.dtype.kind)
+        self.size += n
+        if n:
+            increasing = n == 1 or bool(np.all(times[1:] > times[:-1]))
+            self._track_times(times[0].item(), times[-1].item(), increasing, times)
+            if self.window_stats is not None:
+                last = times[-1].item() if increasing else times.max().item()
+                self.window_stats.add(last, *_batch_summary(values))
+            for rollup in self.rollups.values():
+                rollup.extend(times, values)
+
+
+class DataLogger:
+    def __init__(self, value_dtype=None, log_file=None, block_size=4096, max_samples=None, spill_file=None,
+                 background=False, checkpoint_interval=5.0, checkpoint_samples=None, stats_window=None,
+                 compress=False, rollups=None, reorder_window=None):
+        """
+        Initializes an empty column store.
         The dictionary will have keys for each sensor.
-        Each value is a tuple: (list_of_times, list_of_sensor_values)
+        Each value is a _Column holding a growable NumPy array of times and one of
+        sensor values.
+
+        :param value_dtype: Optional fixed dtype for sensor values (e.g. np.float32
+            to halve memory). By default integer sensors are stored as int64 and
+            everything else as float64.
+        :param log_file: Optional path of an append-only binary log (see
+            binary_log.py). Every time a sensor collects block_size new samples
+            they are written to the log as one block, so a crash loses at most
+            the last partial block. Call flush() to also write partial blocks.
+            Instead of a path this can be another log object with the same
+            write_block/flush/close interface, e.g. an SQLiteLog from
+            sqlite_backend.py (block_size and compress are then ignored).
+        :param block_size: Number of samples per block in the binary log.
+        :param max_samples: Optional cap on the samples each sensor keeps in
+            memory. Each column is preallocated for 2 * max_samples samples;
+            when it fills up, everything but the newest max_samples is moved out
+            in one block, so memory stays bounded however long the run is.
+        :param spill_file: Optional path of a compressed binary log that the
+            evicted blocks are written to. query and resample read them back
+            transparently, and duplicate time stamps are still detected against
+            them. Without a spill file evicted samples are discarded.
+        :param background: Do all log and spill file writes on a background
+            thread (see BackgroundWriter in binary_log.py). Ingestion only hands
+            copies of finished blocks to a queue and never waits for the disk.
+            Requires a log_file or spill_file.
+        :param checkpoint_interval: In background mode, seconds between
+            checkpoints. A checkpoint also hands over every sensor's partial
+            block, so at most this much data is lost in a crash. Checkpoints are
+            taken by the next process_* call once the interval has passed.
+        :param checkpoint_samples: In background mode, also checkpoint after
+            this many new samples (None to only use the interval).
+        :param stats_window: Optional length of a sliding window, in time
+            stamp units (ms for TIME:<ms> messages), over which stats also
+            reports the most recent samples' statistics.
+        :param compress: Compression of the log_file blocks: False, "zlib" or
+            "gorilla" (delta-of-delta time stamps and XOR compressed values,
+            see binary_log.py). The spill file uses the same codec, or zlib
+            when this is False.
+        :param rollups: Optional retention tiers as a list of (period,
+            max_buckets) pairs. For each one, every sensor keeps buckets of
+            `period` time units holding the count, mean, min and max of its
+            samples, updated as they arrive, and retains at least the newest
+            max_buckets of them (up to twice that; None for all). Combined with max_samples this keeps full
+            resolution only for recent data, e.g. with TIME in ms:
+                DataLogger(max_samples=30000, rollups=[(1000, 3600), (60000, None)])
+            holds the last 30000 samples, 1 s buckets for the last hour and
+            1 min buckets for the whole run. See rollup.
+        :param reorder_window: Optional lateness bound, in time stamp units.
+            Each sensor's samples are then held in a small reorder buffer until
+            they are this much older than the newest sample, and stored in time
+            order, so out-of-order UDP packets still give sorted arrays (and
+            linear-time query, resample and CSV export). Samples arriving later
+            than that are discarded with a warning. Held samples are not
+            visible to get_data or query until they are released; flush,
+            close and the save_* methods release them all.
+        """
+        # Validate everything before any state is set up, so a failed
+        # constructor leaves nothing for __del__ to save or close
+        if background and log_file is None and spill_file is None:
+            raise ValueError("background=True needs a log_file or spill_file to write to")
+        rollups = [(period, max_buckets) for period, max_buckets in rollups or ()]
+        for period, max_buckets in rollups:
+            if period <= 0 or (max_buckets is not None and max_buckets < 1):
+                raise ValueError("Invalid rollup tier ({}, {})".format(period, max_buckets))
+        self.value_dtype = value_dtype
+        self.columns = {}
+        if log_file is None or hasattr(log_file, "write_block"):
+            self.log = log_file
+        else:
+            self.log = BinaryLogWriter(log_file, block_size, compress)
+        self._logged = {}  # Number of samples of each sensor already in the log
+        self.max_samples = max_samples
+        self.spill = BinaryLogWriter(spill_file, compress=compress or "zlib") if spill_file else None
+        # sensor -> [first_time, last_time, offset, data] of blocks in the spill
+        # file; data holds the block's arrays until the background writer has
+        # written it and filled in the offset.
+        self._spilled = {}
+        self.writer = BackgroundWriter(checkpoint_interval) if background else None
+        self._writer_errors = 0  # Writer errors already warned about
+        self.checkpoint_samples = checkpoint_samples
+        self._since_checkpoint = 0
+        self._schema = None  # Key order cached by process_strings
+        self._schema_regex = None
+        self.layouts = {}  # Binary record layouts registered for process_bytes
+        self.stats_window = stats_window
+        self.rollups = rollups
+        self.reorder_window = reorder_window
+        self._reorder = {}  # sensor -> _ReorderBuffer
+        self._closed = False
+        if self.log is not None or self.spill is not None:
+            _open_loggers.add(self)
+
+    @classmethod
+    def from_log(cls, filename, value_dtype=None):
+        """
+        Creates a DataLogger holding the contents of a binary log, e.g. to export
+        a crashed session with save_to_csv, or one written by save_log. The
+        blocks are decoded one at a time and copied straight into the columns.
+        For read-only analysis without copying, use BinaryLogReader(filename)
+        directly.
+        """
+        logger = cls(value_dtype)
+        for sensor, times, values in iter_blocks(filename):
+            logger._column(sensor).extend(times, values)
+        return logger
+
+    def _column(self, sensor):
+        """
+        Returns the column for a sensor, creating it the first time it is seen.
+        """
+        column = self.columns.get(sensor)
+        if column is None:
+            capacity = 2 * self.max_samples if self.max_samples else None
+            column = _Column(self.value_dtype, capacity, self.stats_window, self.rollups)
+            self.columns[sensor] = column
+        return column
+
+    def _appended(self, sensor, column, n=1):
+        """
+        Called after n samples were added to a column: writes full blocks to the
+        binary log, evicts old samples in ring buffer mode and takes a
+        checkpoint when one is due.
+        """
+        if self.log is not None:
+            self._persist(sensor, column)
+        if self.max_samples is not None and column.size >= 2 * self.max_samples:
+            self._evict(sensor, column)
+        if self.writer is not None:
+            self._since_checkpoint += n
+            if self.writer.checkpoint_due or (self.checkpoint_samples is not None
+                                              and self._since_checkpoint >= self.checkpoint_samples):
+                self._checkpoint()
+
+    def _store(self, sensor, column, t, v):
+        """
+        Stores one sample, through the sensor's reorder buffer if there is one.
+        """
+        if self.reorder_window is None:
+            column.append(t, v)
+            self._appended(sensor, column)
+            return
+        buffer = self._reorder.get(sensor)
+        if buffer is None:
+            buffer = self._reorder[sensor] = _ReorderBuffer(self.reorder_window)
+        if buffer.is_late(t):
+            print("Warning: TIME {} for sensor '{}' arrived more than the reorder window late; discarding it.".format(t, sensor))
+            return
+        self._store_released(sensor, column, *buffer.push(t, v))
+
+    def _store_released(self, sensor, column, times, values):
+        """
+        Stores the lists of samples released by a reorder buffer. They are
+        appended one by one, so each keeps its int or float type.
+        """
+        for t, v in zip(times, values):
+            column.append(t, v)
+        if times:
+            self._appended(sensor, column, len(times))
+
+    def _store_many(self, sensor, column, times, values):
+        """
+        Stores a batch of samples, through the sensor's reorder buffer if there
+        is one.
+        """
+        if self.reorder_window is not None:
+            buffer = self._reorder.get(sensor)
+            if buffer is None:
+                buffer = self._reorder[sensor] = _ReorderBuffer(self.reorder_window)
+            if buffer.released is not None:
+                late = times <= buffer.released
+                if late.any():
+                    print("Warning: {} samples for sensor '{}' arrived more than the reorder window late; discarding them.".format(int(late.sum()), sensor))
+                    times, values = times[~late], values[~late]
+                    if len(times) == 0:
+                        return
+            times, values = buffer.push_many(times, values)
+            if isinstance(times, list):
+                self._store_released(sensor, column, times, values)
+                return
+            if len(times) == 0:
+                return
+        column.extend(times, values)
+        self._appended(sensor, column, len(times))
+
+    def release_pending(self):
+        """
+        Stores every sample still held in the reorder buffers. Samples that
+        arrive afterwards must be newer than them to be kept.
+        """
+        for sensor, buffer in self._reorder.items():
+            self._store_released(sensor, self.columns[sensor], *buffer.drain())
+
+    def _checkpoint(self):
+        """
+        Hands every sensor's unwritten samples, including partial blocks, to the
+        background writer.
+        """
+        self.writer.checkpoint_due = False
+        self._since_checkpoint = 0
+        if self.log is not None:
+            for sensor, column in self.columns.items():
+                self._persist(sensor, column, partial=True)
+
+    def _write_block(self, log, sensor, times, values, on_written=None):
+        """
+        Writes a block now, or queues a copy of it for the background writer.
+        Returns the block's offset when it was written synchronously.
+        """
+        if self.writer is not None:
+            self.writer.submit(log, sensor, times.copy(), values.copy(), on_written)
+            return None
+        offset = log.write_block(sensor, times, values)
+        log.flush()
+        if on_written is not None:
+            on_written(offset)
+        return offset
+
+    def _evict(self, sensor, column):
+        """
+        Moves all but the newest max_samples samples of a column out of memory,
+        into the spill file if there is one.
+        """
+        drop = column.size - self.max_samples
+        if self.log is not None:
+            self._persist(sensor, column, partial=True)
+            self._logged[sensor] -= drop
+        if self.spill is not None:
+            times, values = column.times[:drop].copy(), column.values[:drop].copy()
+            entry = [times.min().item(), times.max().item(), None, (times, values)]
+            self._spilled.setdefault(sensor, []).append(entry)
+
+            def written(offset, entry=entry):
+                # Publish the offset before dropping the in-memory copy
+                entry[2] = offset
+                entry[3] = None
+            self._write_block(self.spill, sensor, times, values, written)
+        column.drop_oldest(drop)
+
+    def _spilled_blocks(self, sensor, t0=None, t1=None):
+        """
+        Reads back the spilled blocks of a sensor that may hold times in [t0, t1].
+        Blocks the background writer has not written yet come from memory.
+        """
+        blocks = []
+        for entry in self._spilled.get(sensor, ()):
+            if (t0 is None or entry[1] >= t0) and (t1 is None or entry[0] <= t1):
+                data = entry[3]
+                blocks.append(data if data is not None else read_block(self.spill.filename, entry[2])[1:])
+        return blocks
+
+    def _has_time(self, sensor, column, t):
+        """
+        Returns True if the sensor already has a sample at time t, in memory or
+        in the spill file.
+        """
+        if column.contains_time(t):
+            return True
+        if sensor in self._reorder and self._reorder[sensor].contains(t):
+            return True
+        if sensor not in self._spilled or t > column._max_time:
+            return False
+        return any(np.any(times == t) for times, _ in self._spilled_blocks(sensor, t, t))
+
+    def _persist(self, sensor, column, partial=False):
+        """
+        Writes the sensor's samples that are not in the binary log yet, one full
+        block at a time. With partial=True the last, incomplete block is written
+        too.
+        """
+        start = self._logged.get(sensor, 0)
+        block_size = self.log.block_size
+        if column.size - start < block_size and not (partial and column.size > start):
+            return
+        while column.size - start >= block_size or (partial and column.size > start):
+            end = min(start + block_size, column.size)
+            self._write_block(self.log, sensor, column.times[start:end], column.values[start:end])
+            start = end
+        self._logged[sensor] = start
+
+    def flush(self):
+        """
+        Writes every sample that is not in the binary log yet (including partial
+        blocks) and flushes the file. Does nothing without a log file.
+        In background mode this waits until the writer has caught up.
+        Samples held in reorder buffers are stored first.
         """
-        self.data = {}
+        self.release_pending()
+        if self.log is None:
+            return
+        for sensor, column in self.columns.items():
+            self._persist(sensor, column, partial=True)
+        if self.writer is None:
+            self.log.flush()
+            return
+        self.writer.wait()
+        self._report_writer_errors()
+
+    def _report_writer_errors(self):
+        """
+        Warns about writes that failed on the background writer thread since
+        the last report.
+        """
+        new = self.writer.errors - self._writer_errors
+        if new:
+            self._writer_errors = self.writer.errors
+            print("Warning: {} background write(s) failed, last with {}; that data is missing from the files.".format(new, self.writer.last_error))
+
+    def close(self, wait=True, compact=True):
+        """
+        Flushes and closes the binary log and the spill file, if there are any.
+
+        :param wait: In background mode, whether to wait for the writer thread
+            to finish. With wait=False the remaining writes, closing and
+            compaction all happen on the writer thread.
+        :param compact: Rewrite the log into full blocks afterwards (merges the
+            small blocks left by checkpoints). Only done in background mode.
+
+        Closing a closed logger does nothing.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        _open_loggers.discard(self)
+        self.release_pending()
+        if self.writer is None:
+            if self.log is not None:
+                self.flush()
+            _close_files(self.log, self.spill, False)
+            return
+        if self.log is not None:
+            for sensor, column in self.columns.items():
+                self._persist(sensor, column, partial=True)
+        self.writer.stop(partial(_close_files, self.log, self.spill, compact), wait)
+        if wait:
+            self._report_writer_errors()
+
+    def flush_stats(self):
+        """
+        Returns the background writer's metrics (queue depth, flush latency,
+        blocks written, failed writes), or None when not running in background
+        mode.
+        """
+        return self.writer.stats() if self.writer is not None else None
 
     def process_string(self, s):
         """
@@ -68,69 +1237,453 @@ class DataLogger:
             print("Warning: No TIME field in message; discarding data.")
             return
 
-        # Add each sensor's data into the logger's data dictionary.
+        # Add each sensor's data into the logger's columns.
         for sensor, val in message_data.items():
-            if sensor not in self.data:
-                # Automatically create an entry for a new sensor.
-                self.data[sensor] = ([], [])
+            # Automatically creates an entry for a new sensor.
+            column = self._column(sensor)
             # Check for duplicate time stamp for this sensor.
-            if time_value in self.data[sensor][0]:
+            if self._has_time(sensor, column, time_value):
                 print("Warning: Duplicate TIME {} for sensor '{}' in logger; skipping update for this sensor.".format(time_value, sensor))
             else:
-                self.data[sensor][0].append(time_value)
-                self.data[sensor][1].append(val)
+                self._store(sensor, column, time_value, val)
+
+    def process_strings(self, messages):
+        """
+        Parses many "SENSOR1:<value1>, ..., TIME:<time>" messages in one call.
+
+        :param messages: An iterable of message strings (or bytes), or a single
+            str/bytes buffer holding one message per line.
+
+        The key order of the first well formed message is cached as a schema and
+        compiled into a regex. Consecutive messages that match it are parsed
+        together: their values are converted column by column with NumPy and
+        appended to the sensors in bulk. Any message that does not match the
+        schema (different keys, odd values, malformed) goes through
+        process_string, so it is validated and warned about exactly as before.
+        The results, including duplicate time stamp warnings, are the same as
+        calling process_string on every message in order.
+        """
+        if isinstance(messages, (bytes, bytearray, memoryview)):
+            messages = bytes(messages).decode('utf-8')
+        if isinstance(messages, str):
+            messages = messages.splitlines()
+
+        run = []  # Parsed values of consecutive messages matching the schema
+        for message in messages:
+            if isinstance(message, (bytes, bytearray)):
+                message = message.decode('utf-8')
+            if self._schema is None:
+                keys = _message_schema(message)
+                if keys is not None:
+                    self._schema = keys
+                    self._schema_regex = _schema_regex(keys)
+            match = self._schema_regex.fullmatch(message) if self._schema is not None else None
+            if match is not None:
+                run.append(match.groups())
+                continue
+            if run:
+                self._process_rows(run)
+                run = []
+            self.process_string(message)
+        if run:
+            self._process_rows(run)
+
+    def _process_rows(self, rows):
+        """
+        Stores the values captured from messages matching the cached schema.
+        """
+        fields = list(zip(*rows))
+        time_index = [key.upper() for key in self._schema].index("TIME")
+        times = np.array(fields[time_index]).astype(np.int64)
+        sensors = []
+        mixed = False
+        for key, cells in zip(self._schema, fields):
+            if key.upper() == "TIME":
+                continue
+            joined = ''.join(cells)
+            is_float = '.' in joined or 'e' in joined or 'E' in joined
+            values = np.array(cells).astype(np.float64 if is_float else np.int64)
+            if is_float and any(_INT_TEXT.fullmatch(cells[i])
+                                for i in np.flatnonzero(values == np.floor(values)).tolist()):
+                # Integer text among floats (e.g. "0" from a sensor that
+                # usually sends "0.5"): keep each value's type like process_string
+                values = [int(cell) if _INT_TEXT.fullmatch(cell) else float(cell) for cell in cells]
+                mixed = True
+            sensors.append((key, values))
+
+        if not mixed:
+            for key, values in sensors:
+                column = self._column(key)
+                in_order = column.size == 0 or times[0] > column._max_time
+                buffer = self._reorder.get(key)
+                if buffer is not None and buffer.max_time is not None:
+                    in_order = in_order and times[0] > buffer.max_time
+                if not (in_order and (len(times) == 1 or np.all(times[1:] > times[:-1]))):
+                    break
+            else:
+                # No time stamp can be a duplicate: append every sensor in bulk.
+                for key, values in sensors:
+                    self._store_many(key, self._column(key), times, values)
+                return
+
+        # Late or repeated time stamps, or mixed int and float values: store
+        # them one message at a time.
+        sensors = [(key, self._column(key), values if isinstance(values, list) else values.tolist())
+                   for key, values in sensors]
+        for i, time_value in enumerate(times.tolist()):
+            for sensor, column, values in sensors:
+                if self._has_time(sensor, column, time_value):
+                    print("Warning: Duplicate TIME {} for sensor '{}' in logger; skipping update for this sensor.".format(time_value, sensor))
+                else:
+                    self._store(sensor, column, time_value, values[i])
+
+    def process_dict(self, data_dict, time_sensor=True):
+        """
+        Processes a dictionary of sensor data and updates the internal columns.
+
+        The expected dictionary format is:
+            {"SENSOR1": [value1, value2, ...], "SENSOR2": [value1, value2, ...], ..., "TIME": [time1, time2, ...]}
+        where:
+            - Each key is a sensor name.
+            - The TIME key is mandatory.
+            - Sensor values must be either ints or floats.
+            - All lists must have the same length.
+        The values may be lists, tuples (e.g. slices of a struct.unpack result) or
+        NumPy arrays; each one is copied into its column in a single vectorized step.
+
+        :param time_sensor: Also store TIME as a sensor of its own, as before.
+            With False the TIME list only time stamps the other sensors.
+        
+        If the dictionary is missing the TIME field, contains non-numeric sensor values,
+        or if the lists have inconsistent lengths, a warning is printed and the data is discarded.
+        """
+        # Check if TIME exists in the dictionary
+        if "TIME" not in data_dict:
+            print("Warning: No TIME field in dictionary; discarding data.")
+            return
+        
+        # Check if all lists have the same length
+        list_lengths = [len(values) for values in data_dict.values()]
+        if len(set(list_lengths)) > 1:
+            print("Warning: Inconsistent list lengths in dictionary; discarding data.")
+            return
+        
+        # Get the length of the lists
+        data_length = list_lengths[0]
+        if data_length == 0:
+            print("Warning: Empty lists in dictionary; no data to process.")
+            return
+        
+        # Convert every list to an array once and make sure it is numeric
+        arrays = {}
+        for sensor, values in data_dict.items():
+            array = np.asarray(values)
+            if array.ndim != 1 or array.dtype.kind not in 'biuf':
+                print("Warning: Sensor '{}' values are not numeric; discarding data.".format(sensor))
+                return
+            arrays[sensor] = array
+
+        # Get the time values array
+        time_values = arrays["TIME"]
+        times_mixed = _mixes_ints(data_dict["TIME"], time_values)
+        
+        # Process each sensor data in bulk
+        for sensor, values in arrays.items():
+            if sensor == "TIME" and not time_sensor:
+                continue
+            column = self._column(sensor)
+            if times_mixed or _mixes_ints(data_dict[sensor], values):
+                # Store a list mixing ints and floats one sample at a time, so
+                # each keeps its type
+                for t, v in zip(data_dict["TIME"], data_dict[sensor]):
+                    self._store(sensor, column, t, v)
+                continue
+            # Append all time values and sensor values at once
+            self._store_many(sensor, column, time_values, values)
+
+    def register_layout(self, channels, name="default"):
+        """
+        Registers the layout of a packed binary record for process_bytes.
+
+        :param channels: List of (channel name, dtype, count) tuples in the order
+            they appear in the record, e.g. for the Lab5 Kalman telemetry:
+                [("TIME", "<f4", 50), ("ENCODER_YAW", "<f4", 50), ...]
+            One channel must be called TIME and all counts must be equal.
+        :param name: Name to register the layout under.
+        """
+        names = [channel for channel, _, _ in channels]
+        if "TIME" not in names:
+            raise ValueError("A record layout needs a TIME channel")
+        if len(set(count for _, _, count in channels)) != 1:
+            raise ValueError("All channels of a record layout must have the same count")
+        self.layouts[name] = np.dtype([(channel, dtype, (count,)) for channel, dtype, count in channels])
+
+    def process_bytes(self, data, layout="default"):
+        """
+        Ingests one or more packed records (e.g. a UDP datagram) using a layout
+        registered with register_layout.
+
+        The buffer is viewed in place with np.frombuffer and each channel is
+        copied straight into its column, so no tuples or lists are created. As
+        with process_dict, every channel (including TIME) is stored as a sensor
+        against the TIME channel. If the buffer length is not a multiple of the
+        record size, a warning is printed and the data is discarded.
+        """
+        record = self.layouts[layout]
+        if len(data) == 0 or len(data) % record.itemsize:
+            print("Warning: Received data length ({} bytes) doesn't match the '{}' record size ({} bytes); discarding data.".format(len(data), layout, record.itemsize))
+            return
+        records = np.frombuffer(data, dtype=record)
+        if len(records) == 1:
+            channels = {name: records[name][0] for name in record.names}
+        else:
+            channels = {name: records[name].reshape(-1) for name in record.names}
+
+        time_values = channels["TIME"]
+        for sensor, values in channels.items():
+            self._store_many(sensor, self._column(sensor), time_values, values)
 
     def get_data(self):
         """
-        Returns the internal data dictionary.
+        Returns a dictionary mapping each sensor to a tuple (times, values).
+        Both are NumPy views into the logger's storage, not copies. A view keeps
+        showing the samples that existed when it was taken; call get_data again
+        to see newer ones. With max_samples set this is only the samples held
+        in memory; use query for the full history, or DataLogger.from_log on
+        the spill file to export it.
+        """
+        return {sensor: (column.times, column.values) for sensor, column in self.columns.items()}
+
+    def stats(self, sensor):
+        """
+        Returns the running statistics of a sensor without rescanning its
+        samples:
+            {"count": n, "mean": ..., "variance": ..., "std": ..., "min": ..., "max": ...}
+        variance and std are sample (n - 1) estimates. They cover every sample
+        the logger accepted for the sensor, including samples evicted in ring
+        buffer mode. The totals are updated when stats is read, not when
+        samples arrive: a call summarizes the k samples stored since the
+        previous one in a vectorized pass, so it costs O(k) (O(1) if none
+        arrived) and every sample is summarized once in total. The first call
+        after a long run without polling therefore scans that whole stretch;
+        polling regularly (e.g. from a dashboard) keeps each call short.
+        With stats_window set, the dictionary also has a "window" entry with
+        the same statistics over the samples whose time stamps are within
+        stats_window of the newest one (a batch from process_dict or
+        process_bytes counts as a whole until its newest sample leaves the
+        window). Unknown sensors return None with a warning.
+        """
+        column = self.columns.get(sensor)
+        if column is None:
+            print("Warning: No data for sensor '{}'.".format(sensor))
+            return None
+        result = column.stats().summary()
+        if column.window_stats is not None:
+            result["window"] = column.window_stats.summary()
+        return result
+
+    def rollup(self, sensor, period, t0=None, t1=None):
+        """
+        Returns the buckets of one of the rollup tiers of a sensor.
+
+        :param sensor: Sensor name.
+        :param period: Bucket period of a tier passed to the constructor.
+        :param t0: Earliest bucket start to return (None for the oldest kept).
+        :param t1: Latest bucket start to return (None for the newest).
+        :return: {"TIME": bucket starts, "count": ..., "mean": ..., "min": ...,
+            "max": ...}, or None with a warning for an unknown sensor.
+
+        The newest bucket is still open and grows as samples arrive. Buckets
+        are computed on ingest, so this never touches the raw samples and works
+        for data that ring buffer mode has long evicted.
+        """
+        column = self.columns.get(sensor)
+        if column is None:
+            print("Warning: No data for sensor '{}'.".format(sensor))
+            return None
+        if period not in column.rollups:
+            raise ValueError("No rollup tier with period {}; configured: {}".format(period, list(column.rollups)))
+        return column.rollups[period].table(t0, t1)
+
+    DOWNSAMPLE_METHODS = {'lttb': lttb, 'minmax': minmax_decimate}
+
+    def downsample(self, sensors, n_points=2000, method='lttb', t0=None, t1=None):
+        """
+        Reduces one or more sensors to about n_points points each for plotting,
+        keeping the visually important ones (see downsample.py).
+
+        :param sensors: A sensor name or a list of sensor names.
+        :param n_points: Number of points to keep per sensor.
+        :param method: 'lttb' or 'minmax'.
+        :param t0: Start of the time range (None for the first sample).
+        :param t1: End of the time range (None for the last sample).
+        :return: A dictionary mapping each sensor to (times, values), like query.
+
+        For example, to review a whole run:
+            for sensor, (t, v) in logger.downsample(["IMU_YAW", "KALMAN"]).items():
+                plt.plot(t, v, label=sensor)
+        """
+        if method not in self.DOWNSAMPLE_METHODS:
+            raise ValueError("Unknown downsample method '{}'; expected one of {}".format(method, tuple(self.DOWNSAMPLE_METHODS)))
+        decimate = self.DOWNSAMPLE_METHODS[method]
+        return {sensor: decimate(times, values, n_points)
+                for sensor, (times, values) in self.query(sensors, t0, t1).items()}
+
+    RESAMPLE_METHODS = ('linear', 'previous', 'mean', 'min', 'max', 'last', 'count')
+
+    def query(self, sensors, t0=None, t1=None):
+        """
+        Returns the samples of one or more sensors with t0 <= time <= t1.
+
+        :param sensors: A sensor name or a list of sensor names.
+        :param t0: Start of the time range (None for the first sample).
+        :param t1: End of the time range (None for the last sample).
+        :return: A dictionary mapping each sensor to (times, values) sorted by time.
+
+        The range is found with a binary search (searchsorted), so the cost
+        does not depend on how much data is outside it. For sensors whose times
+        arrived in order the arrays are views into the logger's storage; out of
+        order sensors are sorted into a copy first. Unknown sensors are skipped
+        with a warning. In ring buffer mode, spilled blocks overlapping the
+        range are read back from disk and merged with the in-memory samples.
         """
-        return self.data
+        if isinstance(sensors, str):
+            sensors = [sensors]
+        result = {}
+        for sensor in sensors:
+            column = self.columns.get(sensor)
+            if column is None:
+                print("Warning: No data for sensor '{}'; skipping it.".format(sensor))
+                continue
+            spilled = self._spilled_blocks(sensor, t0, t1) if sensor in self._spilled else []
+            if spilled:
+                spilled.append((column.times, column.values))
+                times, values = _sorted_by_time(np.concatenate([times for times, _ in spilled]),
+                                                np.concatenate([values for _, values in spilled]))
+            elif column._sorted:
+                times, values = column.times, column.values
+            else:
+                times, values = _sorted_by_time(column.times, column.values)
+            start = 0 if t0 is None else int(np.searchsorted(times, t0, 'left'))
+            stop = len(times) if t1 is None else int(np.searchsorted(times, t1, 'right'))
+            result[sensor] = (times[start:stop], values[start:stop])
+        return result
+
+    def resample(self, sensors, period, method='linear', t0=None, t1=None):
+        """
+        Aligns one or more sensors onto a common, evenly spaced time grid.
+
+        :param sensors: A sensor name or a list of sensor names.
+        :param period: Spacing of the grid, in the same units as the time stamps.
+        :param method: How each sensor's values are mapped onto the grid:
+            - 'linear': linear interpolation at each grid time.
+            - 'previous': the last sample at or before each grid time.
+            - 'mean', 'min', 'max', 'last', 'count': aggregate of the samples in
+              the bucket [grid time, grid time + period).
+        :param t0: First grid time (default: earliest sample of the sensors).
+        :param t1: Last time covered by the grid (default: latest sample).
+        :return: A dictionary in the process_dict format, {"TIME": grid,
+            "SENSOR1": values, ...}, with NaN where a sensor has no data. A
+            "TIME" sensor is skipped with a warning, since the grid takes its key.
+
+        Every sensor is mapped onto the grid in one vectorized pass (interp or
+        searchsorted + reduceat), e.g. to compare IMU_YAW and KALMAN sample
+        by sample:
+            aligned = logger.resample(["IMU_YAW", "KALMAN"], 0.01)
+            error = aligned["KALMAN"] - aligned["IMU_YAW"]
+        """
+        if method not in self.RESAMPLE_METHODS:
+            raise ValueError("Unknown resample method '{}'; expected one of {}".format(method, self.RESAMPLE_METHODS))
+        if period <= 0:
+            raise ValueError("period must be positive")
+        if isinstance(sensors, str):
+            sensors = [sensors]
+        if "TIME" in sensors:
+            print("Warning: 'TIME' is the grid of the resampled data; skipping it as a sensor.")
+            sensors = [sensor for sensor in sensors if sensor != "TIME"]
+        data = self.query(sensors, t0, t1)
+        non_empty = [times for times, _ in data.values() if len(times)]
+        if not non_empty:
+            return {"TIME": np.empty(0)}
+        if t0 is None:
+            t0 = min(times[0] for times in non_empty)
+        if t1 is None:
+            t1 = max(times[-1] for times in non_empty)
+
+        grid = t0 + period * np.arange(int(np.floor((t1 - t0) / period)) + 1)
+        result = {"TIME": grid}
+        for sensor, (times, values) in data.items():
+            result[sensor] = _resample_column(times, values, grid, period, method)
+        return result
 
     def save_data(self, filename="data_logger.pkl"):
         """
-        Pickles the internal data dictionary to a file.
+        Pickles the data dictionary returned by get_data to a file.
+        This is an export step; with a log_file the data is already on disk.
         """
+        self.release_pending()
         try:
             with open(filename, "wb") as f:
-                pickle.dump(self.data, f)
+                pickle.dump(self.get_data(), f)
             print("Data successfully pickled to", filename)
         except Exception as e:
             print("Error pickling data:", e)
     
-    def save_to_csv(self, filename="data_logger.csv"):
+    def save_log(self, filename="data_logger.dlog", compress="gorilla", block_size=4096):
+        """
+        Writes every sensor's full history (including spilled samples) to a
+        new binary log, by default with the Gorilla codec. For long runs this is
+        usually an order of magnitude smaller than save_data's pickle; load it
+        back with DataLogger.from_log or BinaryLogReader.
+        """
+        self.release_pending()
+        try:
+            if os.path.exists(filename):
+                os.remove(filename)
+            log = BinaryLogWriter(filename, block_size, compress)
+            try:
+                for sensor, (times, values) in self.query(list(self.columns)).items():
+                    for start in range(0, len(times), block_size):
+                        log.write_block(sensor, times[start:start + block_size], values[start:start + block_size])
+            finally:
+                log.close()
+            print("Data successfully saved to", filename)
+        except Exception as e:
+            print("Error saving log:", e)
+
+    def save_to_csv(self, filename="data_logger.csv", chunk_rows=65536):
         """
         Saves the logged data to a CSV file.
         The first column will be TIME, and each additional column will be a sensor.
         Missing values are left blank.
+
+        The export walks the sensors' time arrays in windows of at most
+        chunk_rows samples per sensor. For each window the row times are the
+        sorted union of the sensors' times, every sensor's values are scattered
+        into it with searchsorted, and the formatted rows are written out, so
+        the memory used stays bounded by chunk_rows however long the log is.
         """
-        if not self.data:
+        self.release_pending()
+        data = self.get_data()
+        if not data:
             print("No data to save.")
             return
 
-        # Collect all unique timestamps
-        all_times = sorted(set(time for sensor in self.data for time in self.data[sensor][0]))
-
         # Prepare the header
-        sensors = sorted(self.data.keys())  # Sort sensor names alphabetically
+        sensors = sorted(data.keys())  # Sort sensor names alphabetically
         headers = ["TIME"] + sensors
-
-        # Create a dictionary to map times to sensor values
-        sensor_data_map = {time: {sensor: None for sensor in sensors} for time in all_times}
-
-        # Populate the dictionary with sensor values
-        for sensor, (times, values) in self.data.items():
-            for t, v in zip(times, values):
-                sensor_data_map[t][sensor] = v
+        columns = [_sorted_by_time(*data[sensor], self.columns[sensor].int_times, self.columns[sensor].int_values)
+                   for sensor in sensors]
+        arrival_order = [sensors.index(sensor) for sensor in data]
 
         # Write to CSV
         try:
             with open(filename, mode='w', newline='') as f:
                 writer = csv.writer(f)
                 writer.writerow(headers)  # Write header row
-                
-                for time in all_times:
-                    row = [time] + [sensor_data_map[time][sensor] if sensor_data_map[time][sensor] is not None else "" for sensor in sensors]
-                    writer.writerow(row)
+
+                for rows in _csv_chunks(columns, chunk_rows, arrival_order):
+                    f.write(rows)
 
             print("Data successfully saved to", filename)
         except Exception as e:
@@ -139,7 +1692,17 @@ class DataLogger:
     def __del__(self):
         """
         Deconstructor that automatically saves the data when the object is deleted.
+        With a binary log only the remaining samples are flushed; otherwise the
+        data is pickled and exported to CSV as before. In background mode the
+        final writes are handed to the writer thread, so this does not block
+        the thread that dropped the last reference.
         """
+        if not hasattr(self, "_closed"):
+            return  # __init__ raised; nothing was logged
+        if self.log is not None:
+            self.close(wait=False)
+            return
+        self.close(wait=False)
         self.save_data()
         self.save_to_csv()
 
@@ -3,6 +3,7 @@ import asyncio
 from collections import deque
 import numpy as np  
 import matplotlib.pyplot as plt
+from downsample import lttb
 import asyncio  # added to support async loop
 
 class LivePlotter:
@@ -40,10 +41,16 @@ class LivePlotter:
         # Removed threading in favor of an async plot loop running in the main thread
 
     def update_plot(self, n_points=1000):
-        """ Update the plot with new data. """
-        self.line_roll.set_data(self.time_data, self.roll_data)
-        self.line_pitch.set_data(self.time_data, self.pitch_data)
-        self.line_yaw.set_data(self.time_data, self.yaw_data)
+        """
+        Update the plot with new data.
+
+        :param n_points: Most points drawn per line. Longer buffers are
+            downsampled with LTTB (see downsample.lttb), which keeps the peaks.
+        """
+        time_data = np.asarray(self.time_data)
+        self.line_roll.set_data(*lttb(time_data, np.asarray(self.roll_data), n_points))
+        self.line_pitch.set_data(*lttb(time_data, np.asarray(self.pitch_data), n_points))
+        self.line_yaw.set_data(*lttb(time_data, np.asarray(self.yaw_data), n_points))
 
         self.ax.set_xlim(min(self.time_data), max(self.time_data))  # Keep x-axis moving
         self.fig.canvas.draw()
@@ -1,143 +1,219 @@
 # udp_client.py (for laptop using Python)
 import socket
-import threading
-import queue
 import asyncio
+import time
+from collections import deque
+from itertools import count
+
+
+class _ListenerProtocol(asyncio.DatagramProtocol):
+    """
+    Hands the datagrams asyncio receives on the listening socket to the UDPClient.
+    """
+    def __init__(self, client):
+        self.client = client
+
+    def datagram_received(self, data, addr):
+        self.client._datagram_received(data, addr)
+
+    def error_received(self, exc):
+        print("Error in listening loop:", exc)
+
 
 class UDPClient:
+    # Most messages handed to batch_callback at once; a full batch is passed
+    # on right away instead of waiting for batch_interval.
+    MAX_BATCH = 1024
+
     def __init__(self, listen_ip='0.0.0.0', listen_port=12345,
-                 remote_ip='10.49.10.167', remote_port=12345, callback=None):
+                 remote_ip='10.49.10.167', remote_port=12345, callback=None,
+                 batch_callback=None, batch_interval=0.01, receive_buffer=1 << 20):
         """
         :param listen_ip: Local IP to bind the listener (default: all interfaces)
         :param listen_port: Local port to listen on for incoming UDP messages.
         :param remote_ip: Pico’s IP address.
         :param remote_port: Pico’s port number.
         :param callback: A function that will be called with each received message.
+        :param batch_callback: Optional function called with lists of received
+            messages, e.g. DataLogger.process_strings. Cheaper than callback at
+            high packet rates; both may be given.
+        :param batch_interval: Longest time in seconds a message waits for
+            batch_callback.
+        :param receive_buffer: Requested size of the socket's kernel receive
+            buffer, so bursts are queued by the OS instead of dropped.
         """
         self.listen_ip = listen_ip
         self.listen_port = listen_port
         self.remote_ip = remote_ip
         self.remote_port = remote_port
         self.callback = callback
-        
+        self.batch_callback = batch_callback
+        self.batch_interval = batch_interval
+
         # Create a UDP socket for listening
         self.listen_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.listen_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer)
         self.listen_sock.bind((self.listen_ip, self.listen_port))
-        self.listen_sock.settimeout(0.5)
-        
+
         # Create a separate UDP socket for sending command messages.
         self.cmd_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.cmd_sock.settimeout(1.0)
-        
+        self.cmd_sock.setblocking(False)
+
         self.listening = False
+        self.transport = None
+        self._batch = []
+        self._batch_handle = None
+        self.packets_received = 0
+        self.bytes_received = 0
 
-        # Queue to hold command responses (ACKs)
-        self.response_queue = queue.Queue()
-    
-    def start_listening(self):
+        # Commands waiting for their ACK: sequence ID -> future resolved by the
+        # receive path with (ack, arrival time)
+        self.pending = {}
+        self._sequence = count(1)
+        # (sequence ID, command, round trip time in s, attempts) of acknowledged commands
+        self.rtts = deque(maxlen=1000)
+
+        # ACKs that matched no pending command, e.g. late duplicates of an
+        # already acknowledged one; they are dropped after being counted.
+        self.unmatched_acks = 0
+
+    async def start_listening(self):
         """
-        Starts a background thread that continuously listens for incoming UDP messages.
-        Each message is passed to the callback function (if provided).
+        Starts receiving UDP messages on the running event loop and returns.
+
+        Every message is passed to callback as it arrives. For batch_callback
+        messages are collected and handed over together, batch_interval
+        seconds after the first of them or once MAX_BATCH are waiting. ACKs
+        resolve the pending send_message calls they belong to; any others are
+        counted in unmatched_acks and dropped.
         """
+        loop = asyncio.get_running_loop()
+        self.transport, _ = await loop.create_datagram_endpoint(lambda: _ListenerProtocol(self),
+                                                                sock=self.listen_sock)
         self.listening = True
-        thread = threading.Thread(target=self.listen_loop, daemon=True)
-        thread.start()
 
-    async def start_listening(self):
-        self.listening = True
-        loop = asyncio.get_running_loop()
-        while self.listening:
-            try:
-                data, addr = await loop.sock_recvfrom(self.listen_sock, 1024)
-                message = data.decode('utf-8')
-                print(f"Received from {addr}: {message}")
-                # If this message looks like an ACK, place it in the queue
-                if message.startswith("ACK:"):
-                    await self.response_queue.put(message)
-                elif self.callback:
-                    self.callback(message)
-            except Exception as e:
-                print("Error in listening loop:", e)
+    def _datagram_received(self, data, addr):
+        """
+        Handles a datagram asyncio read from the listening socket.
+        """
+        self.packets_received += 1
+        self.bytes_received += len(data)
+        try:
+            message = data.decode('utf-8')
+        except UnicodeDecodeError:
+            print("Warning: Non UTF-8 datagram from {}; discarding it.".format(addr))
+            return
+        if message.startswith("ACK:"):
+            self._ack_received(message)
+            return
+
+        if self.callback:
+            self.callback(message)
+        if self.batch_callback:
+            self._batch.append(message)
+            if len(self._batch) >= self.MAX_BATCH:
+                self._flush_batch()
+            elif self._batch_handle is None:
+                self._batch_handle = asyncio.get_running_loop().call_later(self.batch_interval,
+                                                                           self._flush_batch)
+
+    def _flush_batch(self):
+        """
+        Passes the messages collected so far to batch_callback.
+        """
+        if self._batch_handle is not None:
+            self._batch_handle.cancel()
+            self._batch_handle = None
+        batch, self._batch = self._batch, []
+        if batch:
+            self.batch_callback(batch)
+
+    def _ack_received(self, ack):
+        """
+        Resolves the pending command whose sequence ID the ACK carries. ACKs
+        without a known ID are counted in unmatched_acks and dropped.
+        """
+        command, separator, sequence = ack[len("ACK:"):].strip().rpartition('|')
+        future = self.pending.get(int(sequence)) if separator and sequence.isdigit() else None
+        if future is None:
+            self.unmatched_acks += 1
+        elif not future.done():
+            future.set_result(("ACK: " + command, time.perf_counter()))
 
     async def send_message(self, message, retries=3, timeout=1.0):
-        for attempt in range(retries):
-            try:
-                await self.cmd_sock.sendto(message.encode('utf-8'), (self.remote_ip, self.remote_port))
-                print(f"Sent command: {message} to {self.remote_ip}:{self.remote_port}")
+        """
+        Sends a command to the Pico and waits for its ACK, resending it up to
+        `retries` times.
 
-                # Wait for a matching ACK from the queue
+        The command goes out as "<message>|<sequence ID>". The Pico's listener
+        echoes it back as "ACK: <message>|<sequence ID>", and the receive path
+        uses the ID to resolve this call's future, so any number of
+        send_message calls can be in flight at once without taking each
+        other's ACKs. Every attempt reuses the ID, so a late ACK for an earlier
+        attempt still counts. The round trip time (from the last send) is
+        appended to self.rtts.
+
+        :return: The ACK without the sequence ID, e.g. "ACK: TURN_ON_STREAM",
+            or None if none arrived.
+        """
+        sequence = next(self._sequence)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[sequence] = future
+        tagged = "{}|{}".format(message, sequence).encode('utf-8')
+        try:
+            for attempt in range(retries):
                 try:
-                    ack = await asyncio.wait_for(self.response_queue.get(), timeout)
-                    if message in ack:  # Simple matching; refine as needed
-                        print(f"Received ACK: {ack}")
-                        return ack
+                    sent = time.perf_counter()
+                    self.cmd_sock.sendto(tagged, (self.remote_ip, self.remote_port))
+                    print(f"Sent command: {message} to {self.remote_ip}:{self.remote_port}")
+
+                    # shield keeps the future alive when a wait times out
+                    ack, received = await asyncio.wait_for(asyncio.shield(future), timeout)
+                    rtt = received - sent
+                    self.rtts.append((sequence, message, rtt, attempt + 1))
+                    print(f"Received ACK: {ack} ({rtt * 1000:.1f} ms)")
+                    return ack
                 except asyncio.TimeoutError:
                     print(f"No ACK received, retrying... (attempt {attempt + 1}/{retries})")
-            except Exception as e:
-                print("Error in send_message:", e)
+                except OSError as e:
+                    print("Error in send_message:", e)
+        finally:
+            del self.pending[sequence]
         print(f"Failed to receive ACK after {retries} attempts.")
         return None
-            
-
-    #def listen_loop(self):
-    #    print("UDPClient listening for incoming messages on {}:{}".format(self.listen_ip, self.listen_port))
-    #    while self.listening:
-    #        try:
-    #            data, addr = self.listen_sock.recvfrom(1024)
-    #            message = data.decode('utf-8')
-    #            print("Received from {}: {}".format(addr, message))
-    #            # If this message looks like an ACK, place it in the queue
-    #            if message.startswith("ACK:"):
-    #                self.response_queue.put(message)
-    #            elif self.callback:
-    #                self.callback(message)
-    #        except socket.timeout:
-    #            continue
-    #        except Exception as e:
-    #            print("Error in listening loop:", e)
-
-    #def send_message(self, message, retries=3, timeout=1.0):
-    #    """
-    #    Sends a message to the Pico and waits for an ACK response.
-    #    Uses the response_queue to capture the ACK.
-    #    """
-    #    for attempt in range(retries):
-    #        try:
-    #            # Send the command message
-    #            self.cmd_sock.sendto(message.encode('utf-8'), (self.remote_ip, self.remote_port))
-    #            print("Sent command: {} to {}:{}".format(message, self.remote_ip, self.remote_port))
-    #            
-    #            # Wait for a matching ACK from the queue
-    #            start_time = time.time()
-    #            while time.time() - start_time < timeout:
-    #                try:
-    #                    # Non-blocking get with small timeout
-    #                    ack = self.response_queue.get(timeout=0.1)
-    #                    # Check if this ACK corresponds to the command (could use identifiers here)
-    #                    if message in ack:  # Simple matching; refine as needed
-    #                        print("Received ACK: {}".format(ack))
-    #                        return ack
-    #                except queue.Empty:
-    #                    continue
-    #            print("No ACK received, retrying... (attempt {}/{})".format(attempt+1, retries))
-    #        except Exception as e:
-    #            print("Error in send_message:", e)
-    #    print("Failed to receive ACK after {} attempts.".format(retries))
-    #    return None
-    
+
+    def rtt_stats(self):
+        """
+        Returns count, mean, p50, p99 and max round trip time (in ms) of the
+        commands recorded in self.rtts, or None if there are none.
+        """
+        if not self.rtts:
+            return None
+        rtts = sorted(rtt * 1000 for _, _, rtt, _ in self.rtts)
+        return {"count": len(rtts), "mean": sum(rtts) / len(rtts), "p50": rtts[len(rtts) // 2],
+                "p99": rtts[min(len(rtts) - 1, int(len(rtts) * 0.99))], "max": rtts[-1]}
+
     def stop_listening(self):
         """
-        Stops the background listening thread.
+        Stops receiving messages and closes the listening socket.
         """
         self.listening = False
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+        if self.batch_callback:
+            self._flush_batch()
 
 # Example usage on laptop:
-# def my_callback(msg):
-#     print("Callback received message:", msg)
+# async def main():
+#     def my_callback(msg):
+#         print("Callback received message:", msg)
+#
+#     client = UDPClient(remote_ip='10.49.10.167', listen_port=12345, callback=my_callback)
+#     await client.start_listening()
 #
-# client = UDPClient(remote_ip='10.49.10.167', listen_port=12345, callback=my_callback)
-# client.start_listening()
+#     # To send a command (with retries for acknowledgement):
+#     response = await client.send_message("TURN_ON_STREAM", retries=3, timeout=1.0)
+#     print("Final response:", response)
 #
-# # To send a command (with retries for acknowledgement):
-# response = client.send_message("TURN_ON_STREAM", retries=3, timeout=1.0)
-# print("Final response:", response)
+# asyncio.run(main())
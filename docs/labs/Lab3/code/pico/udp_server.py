@@ -5,23 +5,37 @@ import socket
 import network
 
 class UDPServer:
-    def __init__(self, client_ip, local_ip='0.0.0.0', port=12345):
+    def __init__(self, client_ip, local_ip='0.0.0.0', port=12345, header=False, command_callback=None):
+        """
+        :param header: If True, every message sent with send_message starts with
+            "SEQ:<sequence number>,TICKS:<time.ticks_us()>," so the laptop's
+            StreamStats can count lost, reordered and delayed messages.
+        :param command_callback: Optional function called by listen with each
+            command received, e.g. "TURN_ON_STREAM".
+        """
         self.local_ip = local_ip
         self.client_ip = client_ip
         self.port = port
+        self.header = header
+        self.command_callback = command_callback
+        self.sequence = 0
         # Create and bind a UDP socket
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.sock.bind((self.local_ip, self.port))
         self.sock.setblocking(False)  # set socket to non-blocking mode
         print("UDPServer initialized on {}:{}".format(self.local_ip, self.port))
     
-    def send_message(self, message):
+    def send_message(self, message, add_header=True):
         """
         Sends a message (as a string) to the given client address.
         The message is sent without waiting for a response.
         :param message: String to send.
-        :param client_addr: Tuple (client_ip, client_port)
+        :param add_header: Set to False to leave out the sequence header even if
+            the server was created with header=True (used for ACKs).
         """
+        if self.header and add_header:
+            message = "SEQ:{},TICKS:{},{}".format(self.sequence, time.ticks_us(), message)
+            self.sequence = (self.sequence + 1) & 0xFFFFFFFF
         try:
             self.sock.sendto(message.encode('utf-8'), (self.client_ip, self.port))
             print("Sent message to {}: {}".format((self.client_ip, self.port), message))
@@ -32,6 +46,11 @@ class UDPServer:
         """
         Asynchronously listens for incoming UDP messages.
         When a message is received, it prints it and sends an ACK back.
+
+        The laptop's UDPClient sends commands as "<command>|<sequence ID>".
+        Only the command is passed to command_callback; the ID is echoed back
+        in the ACK, "ACK: <command>|<sequence ID>", so the laptop can tell
+        which command it acknowledges.
         """
         print("UDPServer listening for incoming messages...")
         while True:
@@ -39,10 +58,17 @@ class UDPServer:
                 data, addr = self.sock.recvfrom(1024)  # non-blocking call
                 if data:
                     message = data.decode('utf-8')
-                    print("Received from {}: {}".format(addr, message))
+                    command, separator, sequence = message.rpartition('|')
+                    if not separator or not sequence.isdigit():
+                        command, sequence = message, None
+                    print("Received from {}: {}".format(addr, command))
+                    if self.command_callback:
+                        self.command_callback(command)
                     # Send an acknowledgement back to the sender
-                    ack_message = "ACK: " + message
-                    self.send_message(ack_message)
+                    ack_message = "ACK: " + command
+                    if sequence is not None:
+                        ack_message += "|" + sequence
+                    self.send_message(ack_message, add_header=False)
             except OSError:
                 # No data available; yield control to allow other tasks to run
                 await asyncio.sleep(0.01)
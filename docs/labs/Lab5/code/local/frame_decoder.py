@@ -0,0 +1,103 @@
+import struct
+import numpy as np
+
+# Telemetry frames sent by the Pico's FrameEncoder (pico/frame_encoder.py):
+#     2s magic b"TF", B version, B schema ID, B typecode, B channels, H samples
+# (little-endian, 8 bytes) followed by the channels' samples one after the
+# other. The header says how to read the rest of the frame, so nothing about
+# the Pico's arrays has to be hardcoded on the laptop.
+FRAME_MAGIC = b"TF"
+FRAME_VERSION = 1
+HEADER = struct.Struct("<2sBBBBH")
+
+# Array typecodes the Pico may send, as little-endian NumPy dtypes
+TYPECODES = {
+    'b': '<i1', 'B': '<u1', 'h': '<i2', 'H': '<u2', 'i': '<i4', 'I': '<u4',
+    'l': '<i4', 'L': '<u4', 'q': '<i8', 'Q': '<u8', 'f': '<f4', 'd': '<f8',
+}
+
+
+class Frame:
+    """
+    A decoded frame: its schema ID, channel names and a (channels, samples)
+    array that views the received bytes.
+    """
+    __slots__ = ("schema_id", "names", "values")
+
+    def __init__(self, schema_id, names, values):
+        self.schema_id = schema_id
+        self.names = names
+        self.values = values
+
+    def to_dict(self):
+        """
+        Returns {name: samples}, ready for DataLogger.process_dict.
+        """
+        return dict(zip(self.names, self.values))
+
+
+def encode_frame(schema_id, values, typecode='f'):
+    """
+    Packs a (channels, samples) array into a frame, like the Pico's
+    FrameEncoder does (for tests and emulators on the laptop).
+    """
+    values = np.asarray(values, dtype=TYPECODES[typecode])
+    channels, samples = values.shape
+    return HEADER.pack(FRAME_MAGIC, FRAME_VERSION, schema_id, ord(typecode), channels, samples) + values.tobytes()
+
+
+class FrameDecoder:
+    """
+    Decodes telemetry frames without knowing their sizes in advance.
+
+    Register the channel names of each schema the Pico sends:
+        decoder = FrameDecoder()
+        decoder.register_schema(1, ["TIME", "ENCODER_YAW", "IMU_YAW", "KALMAN", "ESTIMATE_COVARIANCE"])
+        frame = decoder.decode(data)
+        if frame is not None:
+            data_logger.process_dict(frame.to_dict())
+    Frames of an unregistered schema are still decoded, with the channels
+    named TIME, CH1, CH2, ... Malformed frames are counted in `rejected` and
+    discarded with a warning.
+    """
+    def __init__(self):
+        self.schemas = {}
+        self.decoded = 0
+        self.rejected = 0
+
+    def register_schema(self, schema_id, names):
+        """
+        Sets the channel names for frames with this schema ID.
+        """
+        self.schemas[schema_id] = list(names)
+
+    def _reject(self, reason):
+        self.rejected += 1
+        print("Warning: {}; discarding data.".format(reason))
+
+    def decode(self, data):
+        """
+        Returns the Frame in data, or None if it is not a valid frame.
+        """
+        if len(data) < HEADER.size:
+            self._reject("Frame of {} bytes is shorter than its header".format(len(data)))
+            return None
+        magic, version, schema_id, typecode, channels, samples = HEADER.unpack_from(data)
+        if magic != FRAME_MAGIC or version != FRAME_VERSION:
+            self._reject("Not a version {} telemetry frame".format(FRAME_VERSION))
+            return None
+        dtype = TYPECODES.get(chr(typecode))
+        if dtype is None:
+            self._reject("Unknown frame typecode {!r}".format(chr(typecode)))
+            return None
+        count = channels * samples
+        if count == 0 or len(data) - HEADER.size != count * np.dtype(dtype).itemsize:
+            self._reject("Frame of {} bytes doesn't hold the {} x {} samples its header describes"
+                         .format(len(data), channels, samples))
+            return None
+        values = np.frombuffer(data, dtype=dtype, count=count, offset=HEADER.size)
+        names = self.schemas.get(schema_id)
+        if names is None or len(names) != channels:
+            names = ["TIME"] + ["CH{}".format(i) for i in range(1, channels)]
+        self.decoded += 1
+        return Frame(schema_id, names, values.reshape(channels, samples))
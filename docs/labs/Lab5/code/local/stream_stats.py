@@ -0,0 +1,271 @@
+import struct
+import time
+from bisect import bisect_right
+
+# Telemetry header added by the Pico's UDPServer when it is created with
+# header=True. Packed (bytes) packets start with
+#     uint32 sequence number, uint32 time.ticks_us()     (little-endian)
+# so the arrays after it stay 4-byte aligned, and string messages start with
+#     "SEQ:<sequence number>,TICKS:<time.ticks_us()>,"
+# which DataLogger.process_string also accepts as two ordinary sensors.
+HEADER = struct.Struct("<II")
+SEQUENCE_PERIOD = 1 << 32
+# time.ticks_us() wraps around at 2**30 on the Pico (time.ticks_add/ticks_diff)
+TICKS_PERIOD = 1 << 30
+
+# Upper edges (ms) of the inter-arrival time histogram bins; the last bin
+# counts everything above 1 s.
+JITTER_BINS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def split_header(data):
+    """
+    Splits the telemetry header off a packed packet.
+    Returns (sequence, ticks, payload), or None if the packet is too short.
+    """
+    if len(data) < HEADER.size:
+        return None
+    sequence, ticks = HEADER.unpack_from(data)
+    return sequence, ticks, memoryview(data)[HEADER.size:]
+
+
+def split_string_header(message):
+    """
+    Splits the telemetry header off a string message.
+    Returns (sequence, ticks, rest of the message), or None if it has none.
+    """
+    if not message.startswith("SEQ:"):
+        return None
+    parts = message.split(",", 2)
+    try:
+        sequence = int(parts[0][4:])
+        if not parts[1].startswith("TICKS:"):
+            return None
+        ticks = int(parts[1][6:])
+    except (IndexError, ValueError):
+        return None
+    return sequence, ticks, parts[2] if len(parts) > 2 else ""
+
+
+def _wrapped_difference(a, b, period):
+    """
+    Returns a - b for counters that wrap around at period, assuming the true
+    difference is less than half a period in size.
+    """
+    return (a - b + period // 2) % period - period // 2
+
+
+def _source_name(source):
+    """
+    Turns a source key into a sensor name prefix, e.g. ("10.49.1.2", 5005) -> "10.49.1.2:5005".
+    """
+    if source is None:
+        return "STREAM"
+    if isinstance(source, tuple):
+        return ":".join(str(part) for part in source)
+    return str(source)
+
+
+class _SourceStats:
+    """
+    Loss, reordering, jitter and throughput of the packets from one source.
+    """
+    def __init__(self):
+        self.received = 0
+        self.duplicates = 0
+        self.reordered = 0
+        self.bytes = 0
+        self.first_sequence = None
+        self.highest = None  # highest sequence number so far, unwrapped
+        self._seen = set()   # unwrapped sequence numbers within the reorder horizon
+        self.first_arrival = None
+        self.last_arrival = None
+        self._last_ticks = None
+        # RFC 3550 interarrival jitter estimate, in seconds
+        self.jitter = 0.0
+        self.histogram = [0] * (len(JITTER_BINS_MS) + 1)
+
+    def update(self, sequence, ticks, arrival, nbytes, horizon):
+        self.bytes += nbytes
+        if self.highest is None:
+            self.first_sequence = self.highest = sequence
+            self.first_arrival = arrival
+        else:
+            sequence = self.highest + _wrapped_difference(sequence, self.highest % SEQUENCE_PERIOD,
+                                                          SEQUENCE_PERIOD)
+            if sequence in self._seen:
+                self.duplicates += 1
+                return
+            if sequence < self.first_sequence:
+                # Belongs to the stream but was overtaken by the first packet seen
+                self.first_sequence = sequence
+            if sequence < self.highest:
+                self.reordered += 1
+            else:
+                # Inter-arrival time and jitter only between in-order packets
+                gap = arrival - self.last_arrival
+                self.histogram[bisect_right(JITTER_BINS_MS, gap * 1000)] += 1
+                if ticks is not None and self._last_ticks is not None:
+                    sent_gap = _wrapped_difference(ticks, self._last_ticks, TICKS_PERIOD) / 1e6
+                    self.jitter += (abs(gap - sent_gap) - self.jitter) / 16
+                self.highest = sequence
+        if sequence == self.highest:
+            self.last_arrival = arrival
+            self._last_ticks = ticks
+        self.received += 1
+        self._seen.add(sequence)
+        if len(self._seen) > 2 * horizon:
+            # Forget sequence numbers too old to be reordered any more
+            oldest = self.highest - horizon
+            self._seen = {s for s in self._seen if s > oldest}
+
+    @property
+    def expected(self):
+        return 0 if self.highest is None else self.highest - self.first_sequence + 1
+
+    def summary(self):
+        expected = self.expected
+        lost = expected - self.received
+        elapsed = (self.last_arrival - self.first_arrival) if self.received else 0.0
+        return {
+            "received": self.received,
+            "expected": expected,
+            "lost": lost,
+            "loss_rate": lost / expected if expected else 0.0,
+            "reordered": self.reordered,
+            "duplicates": self.duplicates,
+            "jitter_ms": self.jitter * 1000,
+            "packets_per_second": (self.received - 1) / elapsed if elapsed > 0 else 0.0,
+            "bytes_per_second": self.bytes / elapsed if elapsed > 0 else 0.0,
+            "interarrival_histogram": dict(zip(["<={}ms".format(edge) for edge in JITTER_BINS_MS] + [">1000ms"],
+                                               self.histogram)),
+        }
+
+
+class StreamStats:
+    """
+    Tracks loss, reordering, inter-arrival jitter and throughput of the
+    telemetry streams sent by Picos whose UDPServer adds the sequence header
+    (UDPServer(..., header=True)).
+
+    Feed it every packet from the UDPClient callback; it returns the packet
+    without the header:
+        stats = StreamStats()
+        def on_packet(data, addr):
+            payload = stats.process_bytes(data, addr)
+            frame = None if payload is None else decoder.decode(payload)  # a FrameDecoder
+            if frame is not None:
+                data_logger.process_dict(frame.to_dict())
+    (or stats.process_string(message, source) for string messages). Sources are
+    tracked separately, keyed by the address or name they are passed with.
+    stats.summary() returns the numbers per source, stats.report() prints them.
+
+    Loss is counted from gaps in the sequence numbers, so packets still in
+    flight at the end of a stream are not counted, and a packet arriving after
+    a later one is counted as reordered rather than lost. Jitter is the
+    smoothed difference between the arrival spacing and the Pico's send
+    spacing (the RFC 3550 estimator), so it does not depend on the send rate.
+
+    If a DataLogger is given, each source's loss rate, jitter and packet rate
+    are logged to it every log_interval seconds as the sensors
+    "<source>_LOSS_RATE", "<source>_JITTER_MS" and "<source>_PACKET_RATE",
+    timestamped with time.time(). They do not touch the logger's TIME sensor,
+    so the logger can also hold the telemetry itself, but their rows sort
+    after the Pico's TIME:<ms> rows in a CSV export; give StreamStats a
+    DataLogger of its own to keep them in a separate file.
+    """
+    def __init__(self, data_logger=None, log_interval=1.0, reorder_horizon=1024):
+        """
+        :param data_logger: Optional DataLogger to log the statistics to.
+        :param log_interval: Seconds between logged statistics.
+        :param reorder_horizon: How many sequence numbers back a packet may
+            arrive and still be recognised as a duplicate.
+        """
+        self.sources = {}
+        self.malformed = 0
+        self.data_logger = data_logger
+        self.log_interval = log_interval
+        self.reorder_horizon = reorder_horizon
+        self._next_log = time.perf_counter() + log_interval
+
+    def update(self, source, sequence, ticks=None, nbytes=0, arrival=None):
+        """
+        Records one packet.
+
+        :param source: Anything identifying the sender, e.g. its (ip, port).
+        :param sequence: The packet's sequence number.
+        :param ticks: The Pico's time.ticks_us() when the packet was sent.
+        :param nbytes: Size of the packet.
+        :param arrival: Arrival time from time.perf_counter() (default: now).
+        """
+        if arrival is None:
+            arrival = time.perf_counter()
+        stats = self.sources.get(source)
+        if stats is None:
+            stats = self.sources[source] = _SourceStats()
+        stats.update(sequence, ticks, arrival, nbytes, self.reorder_horizon)
+        if self.data_logger is not None and arrival >= self._next_log:
+            self._next_log = arrival + self.log_interval
+            self.log()
+
+    def process_bytes(self, data, source=None):
+        """
+        Records a packed packet and returns its payload without the header
+        (a memoryview), or None if it is too short to have one.
+        """
+        header = split_header(data)
+        if header is None:
+            self.malformed += 1
+            print("Warning: Packet of {} bytes has no sequence header; discarding data.".format(len(data)))
+            return None
+        sequence, ticks, payload = header
+        self.update(source, sequence, ticks, len(data))
+        return payload
+
+    def process_string(self, message, source=None):
+        """
+        Records a string message and returns it without the "SEQ:..,TICKS:..,"
+        header, or None if it has none.
+        """
+        header = split_string_header(message)
+        if header is None:
+            self.malformed += 1
+            print("Warning: Message has no sequence header; discarding data.")
+            return None
+        sequence, ticks, rest = header
+        self.update(source, sequence, ticks, len(message))
+        return rest
+
+    def summary(self, source=None):
+        """
+        Returns a dictionary of statistics for one source, or a dictionary of
+        them keyed by source if none is given.
+        """
+        if source is not None:
+            return self.sources[source].summary()
+        return {source: stats.summary() for source, stats in self.sources.items()}
+
+    def report(self):
+        """
+        Prints a one line summary per source.
+        """
+        for source, summary in self.summary().items():
+            print("{}: {received} received, {lost} lost ({loss_rate:.2%}), {reordered} reordered, "
+                  "{duplicates} duplicates, jitter {jitter_ms:.2f} ms, {packets_per_second:.1f} packets/s, "
+                  "{bytes_per_second:.0f} B/s".format(source, **summary))
+
+    def log(self):
+        """
+        Logs the current statistics of every source to the DataLogger.
+        """
+        now = time.time()
+        for source, stats in self.sources.items():
+            summary = stats.summary()
+            name = _source_name(source)
+            # Keep the epoch time stamps out of the telemetry's TIME sensor
+            self.data_logger.process_dict({
+                "TIME": [now],
+                name + "_LOSS_RATE": [summary["loss_rate"]],
+                name + "_JITTER_MS": [summary["jitter_ms"]],
+                name + "_PACKET_RATE": [summary["packets_per_second"]],
+            }, time_sensor=False)
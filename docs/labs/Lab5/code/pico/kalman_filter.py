@@ -11,7 +11,7 @@ import machine
 import time
 import gc
 from array import array  # Add import for array support
-import struct
+from frame_encoder import FrameEncoder
 
 # Network settings - replace with your values
 WIFI_SSID = "RedRover"    # Your WiFi network name
@@ -97,6 +97,11 @@ imu_yaw_data = array('f', [0.0] * ARRAY_SIZE)
 kalman_data = array('f', [0.0] * ARRAY_SIZE)
 estimate_covarience = array('f', [0.0] * ARRAY_SIZE)
 
+# Packs the 5 arrays into a frame whose header tells the laptop their size and
+# type (udp_client_example.py decodes it), so ARRAY_SIZE can be changed here alone.
+KALMAN_SCHEMA = 1  # Picks the channel names on the laptop
+frame_encoder = FrameEncoder(KALMAN_SCHEMA, 5, ARRAY_SIZE)
+
 # Counter for current array index
 data_index = 0
 
@@ -135,13 +140,8 @@ async def main():
 
         if data_index == ARRAY_SIZE - 1:
 
-            packed_data = (
-                struct.pack('<%df' % ARRAY_SIZE, *time_data) +
-                struct.pack('<%df' % ARRAY_SIZE, *encoder_yaw_data) +
-                struct.pack('<%df' % ARRAY_SIZE, *imu_yaw_data) +
-                struct.pack('<%df' % ARRAY_SIZE, *kalman_data) +
-                struct.pack('<%df' % ARRAY_SIZE, *estimate_covarience)
-            )
+            packed_data = frame_encoder.encode(
+                [time_data, encoder_yaw_data, imu_yaw_data, kalman_data, estimate_covarience])
             print('Sending data:', len(packed_data), ' bytes')
             udp_server.send(packed_data)
             data_index = 0
@@ -1,17 +1,27 @@
 import socket
 import network
+import struct
 import time
 
 class UDPServer:
-    def __init__(self, target_ip, target_port=5005):
+    def __init__(self, target_ip, target_port=5005, header=False):
+        # With header=True every packet starts with an 8 byte header, a uint32
+        # sequence number and the uint32 time.ticks_us() it was sent at
+        # (little-endian), so the laptop's StreamStats can count lost,
+        # reordered and delayed packets. Remember to strip it on the laptop.
         self.target_ip = target_ip
         self.target_port = target_port
+        self.header = header
+        self.sequence = 0
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 
     def send(self, data: str):
         # Data should be a string or bytes
         if isinstance(data, str):
             data = data.encode('utf-8')
+        if self.header:
+            data = struct.pack("<II", self.sequence, time.ticks_us()) + data
+            self.sequence = (self.sequence + 1) & 0xFFFFFFFF
         self.sock.sendto(data, (self.target_ip, self.target_port))
 
 
@@ -0,0 +1,75 @@
+import numpy as np
+
+# Downsampling of time series for plotting, shared by DataLogger.downsample and
+# LivePlotter. Kept apart from data_logger.py so the plotter does not have to
+# import the logger.
+
+
+def lttb(times, values, n_out):
+    """
+    Downsamples a time-sorted series to n_out points with
+    Largest-Triangle-Three-Buckets (Steinarsson, 2013), which keeps the points
+    that matter visually (peaks, dips, steps) rather than every k-th one.
+
+    The first and last points are always kept. The rest are split into
+    n_out - 2 equal buckets and from each one the point forming the largest
+    triangle with the point chosen from the previous bucket and the average of
+    the next bucket is kept. The bucket averages are computed for all buckets
+    at once and each bucket's triangle areas in one vectorized step, so only
+    the chain of chosen points is walked in Python (n_out steps).
+
+    :param times: 1-D array of time stamps, sorted.
+    :param values: 1-D array of values, same length.
+    :param n_out: Number of points to keep (at least 3).
+    :return: (times, values) of the kept points. Series that already have at
+        most n_out points are returned unchanged.
+    """
+    n = len(times)
+    if n <= n_out:
+        return times, values
+    if n_out < 3:
+        raise ValueError("lttb needs n_out >= 3")
+    x = times.astype(np.float64)
+    y = values.astype(np.float64)
+    edges = 1 + np.arange(n_out - 1) * (n - 2) // (n_out - 2)
+    counts = np.diff(edges)
+    mean_x = np.append(np.add.reduceat(x[1:-1], edges[:-1] - 1) / counts, x[-1])
+    mean_y = np.append(np.add.reduceat(y[1:-1], edges[:-1] - 1) / counts, y[-1])
+
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        ax, ay, cx, cy = x[a], y[a], mean_x[i + 1], mean_y[i + 1]
+        # Twice the triangle area for every candidate point of the bucket
+        area = np.abs((ax - cx) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (cy - ay))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return times[keep], values[keep]
+
+
+def minmax_decimate(times, values, n_out):
+    """
+    Downsamples a time-sorted series to about n_out points by splitting it into
+    n_out // 2 equal buckets and keeping the minimum and maximum of each, in
+    time order. Cheaper than lttb and guaranteed to keep every extreme, which
+    suits noisy signals drawn as lines.
+
+    :return: (times, values) of the kept points. Series that already have at
+        most n_out points are returned unchanged.
+    """
+    n = len(times)
+    buckets = max(n_out // 2, 1)
+    if n <= n_out:
+        return times, values
+    edges = np.arange(buckets + 1) * n // buckets
+    # Index matrix of the buckets, padded by repeating each bucket's last index
+    width = int(np.max(np.diff(edges)))
+    index = np.minimum(edges[:-1, None] + np.arange(width), edges[1:, None] - 1)
+    rows = values[index]
+    picks = np.stack([np.take_along_axis(index, np.argmin(rows, axis=1)[:, None], 1)[:, 0],
+                      np.take_along_axis(index, np.argmax(rows, axis=1)[:, None], 1)[:, 0]], axis=1)
+    keep = np.sort(picks, axis=1).ravel()
+    keep = keep[np.concatenate([[True], keep[1:] != keep[:-1]])]
+    return times[keep], values[keep]
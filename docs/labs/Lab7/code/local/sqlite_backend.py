@@ -0,0 +1,165 @@
+import os
+import sqlite3
+import time
+from contextlib import closing
+from itertools import repeat
+import numpy as np
+
+# Database layout
+# ---------------
+#     runs    (id, name, started)           one row per SQLiteLog opened
+#     sensors (id, name, time_dtype, value_dtype)
+#     samples (run, sensor, time, value)    indexed on (sensor, time)
+# Sensors are stored by id so each sample row only holds four numbers. The
+# dtype columns record how DataLogger stored the sensor (widened with
+# np.promote_types if a later block or run stores it differently), so query
+# can hand the arrays back with the same dtypes.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, name TEXT, started REAL);
+CREATE TABLE IF NOT EXISTS sensors (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL,
+                                    time_dtype TEXT, value_dtype TEXT);
+CREATE TABLE IF NOT EXISTS samples (run INTEGER NOT NULL, sensor INTEGER NOT NULL,
+                                    time NUMERIC NOT NULL, value NUMERIC);
+CREATE INDEX IF NOT EXISTS samples_sensor_time ON samples (sensor, time);
+"""
+
+
+class SQLiteLog:
+    """
+    Stores DataLogger samples in an SQLite database, so many runs can be
+    collected in one file and queried with SQL.
+
+    It has the same write_block/flush/close interface as BinaryLogWriter, so it
+    can be passed as a DataLogger's log_file:
+        logger = DataLogger(log_file=SQLiteLog("runs.sqlite", "trial 3"), background=True)
+    Each block is inserted with a single executemany and the inserts are only
+    committed on flush, so in background mode every batch the writer thread
+    drains is one transaction and the thread receiving UDP data never waits
+    for SQLite. (Without background=True every block is committed as it is
+    written, which can stall ingestion for milliseconds.) The database runs in
+    WAL mode, so query (which opens its own connection) can read while a run
+    is being written.
+    """
+    def __init__(self, filename, run_name=None, block_size=4096):
+        """
+        :param filename: Path of the database to create or add a run to.
+        :param run_name: Optional name stored with this run.
+        :param block_size: Number of samples DataLogger collects per block.
+        """
+        self.filename = filename
+        self.block_size = block_size
+        # Written from the background writer thread, created on this one
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        cursor = self.connection.execute("INSERT INTO runs (name, started) VALUES (?, ?)", (run_name, time.time()))
+        self.run = cursor.lastrowid
+        self.connection.commit()
+        self._sensor_ids = {}
+
+    def _sensor_id(self, sensor, times, values):
+        """
+        Returns the id of a sensor, registering it the first time it is seen and
+        widening its recorded dtypes when a block does not fit them.
+        """
+        dtypes = (times.dtype.str, values.dtype.str)
+        known = self._sensor_ids.get(sensor)
+        if known is not None and known[1] == dtypes:
+            return known[0]
+        self.connection.execute("INSERT OR IGNORE INTO sensors (name, time_dtype, value_dtype) VALUES (?, ?, ?)",
+                                (sensor,) + dtypes)
+        sensor_id, time_dtype, value_dtype = self.connection.execute(
+            "SELECT id, time_dtype, value_dtype FROM sensors WHERE name = ?", (sensor,)).fetchone()
+        widened = (np.promote_types(time_dtype, times.dtype).str, np.promote_types(value_dtype, values.dtype).str)
+        if widened != (time_dtype, value_dtype):
+            self.connection.execute("UPDATE sensors SET time_dtype = ?, value_dtype = ? WHERE id = ?",
+                                    widened + (sensor_id,))
+        self._sensor_ids[sensor] = (sensor_id, dtypes)
+        return sensor_id
+
+    def write_block(self, sensor, times, values):
+        """
+        Inserts the samples of one block (uncommitted until flush).
+        Returns None; blocks have no file offset here.
+        """
+        sensor_id = self._sensor_id(sensor, times, values)
+        self.connection.executemany("INSERT INTO samples VALUES (?, ?, ?, ?)",
+                                    zip(repeat(self.run), repeat(sensor_id), times.tolist(), values.tolist()))
+
+    def flush(self):
+        """
+        Commits the blocks written since the last flush.
+        """
+        if self.connection is not None:
+            self.connection.commit()
+
+    def close(self):
+        """
+        Commits and closes the database.
+        """
+        if self.connection is not None:
+            self.connection.commit()
+            self.connection.close()
+            self.connection = None
+
+    def query(self, sensors, t0=None, t1=None, run=None):
+        """
+        Same as the module level query, defaulting to this log's run.
+        """
+        return query(self.filename, sensors, t0, t1, self.run if run is None else run)
+
+
+def runs(filename):
+    """
+    Returns [(id, name, started), ...] for the runs stored in a database.
+    """
+    with closing(sqlite3.connect(filename)) as connection:
+        return connection.execute("SELECT id, name, started FROM runs ORDER BY id").fetchall()
+
+
+def query(filename, sensors, t0=None, t1=None, run=None):
+    """
+    Reads samples back from a database written by SQLiteLog.
+
+    :param filename: Path of the database.
+    :param sensors: A sensor name or a list of sensor names.
+    :param t0: Start of the time range (None for the first sample).
+    :param t1: End of the time range (None for the last sample).
+    :param run: Only return samples of this run id (None for every run).
+    :return: A dictionary mapping each sensor to (times, values) NumPy arrays
+        sorted by time, like DataLogger.query. Unknown sensors are skipped
+        with a warning.
+
+    The time range is answered from the (sensor, time) index.
+    """
+    if isinstance(sensors, str):
+        sensors = [sensors]
+    if not os.path.exists(filename):
+        raise FileNotFoundError(filename)
+    result = {}
+    with closing(sqlite3.connect(filename)) as connection:
+        for sensor in sensors:
+            row = connection.execute("SELECT id, time_dtype, value_dtype FROM sensors WHERE name = ?",
+                                     (sensor,)).fetchone()
+            if row is None:
+                print("Warning: No data for sensor '{}'; skipping it.".format(sensor))
+                continue
+            sensor_id, time_dtype, value_dtype = row
+            sql = "SELECT time, value FROM samples WHERE sensor = ?"
+            args = [sensor_id]
+            if t0 is not None:
+                sql += " AND time >= ?"
+                args.append(t0)
+            if t1 is not None:
+                sql += " AND time <= ?"
+                args.append(t1)
+            if run is not None:
+                sql += " AND run = ?"
+                args.append(run)
+            rows = connection.execute(sql + " ORDER BY time", args).fetchall()
+            times, values = zip(*rows) if rows else ((), ())
+            # SQLite stores NaN as NULL, which converts back to NaN as a float
+            result[sensor] = (np.array(times, dtype=time_dtype), np.array(values, dtype=value_dtype))
+    return result
@@ -1,27 +1,292 @@
 import socket
 import threading
+import time
+from collections import deque
+
+
+class SourceCounters:
+    """
+    Packet counters for one source (robot) sending to a UDPClient.
+    """
+    def __init__(self, now):
+        self.packets = 0
+        self.bytes = 0
+        self.unhandled = 0  # packets with no handler to go to
+        self.errors = 0     # packets whose handler raised an exception
+        self.first_seen = now
+        self.last_seen = now
+
+    def summary(self):
+        elapsed = self.last_seen - self.first_seen
+        return {
+            "packets": self.packets,
+            "bytes": self.bytes,
+            "unhandled": self.unhandled,
+            "errors": self.errors,
+            "packets_per_second": (self.packets - 1) / elapsed if elapsed > 0 else 0.0,
+            "seconds_since_last": time.perf_counter() - self.last_seen,
+        }
+
+
+class HandoffQueue:
+    """
+    Bounded queue that hands received packets from the UDPClient's receive
+    thread to the thread running the handlers, so a slow handler (logging,
+    plotting) never stops the socket from being read.
+
+    What happens when the queue is full depends on the policy:
+        "block"           the receive thread waits for room (nothing is dropped
+                          here, but the kernel drops packets once its buffer fills)
+        "drop-oldest"     the oldest queued packet is dropped to make room
+        "drop-newest"     the arriving packet is dropped
+        "coalesce-latest" only the latest packet of each source is kept: a new
+                          packet replaces the one still waiting from its source
+    Packets dropped by the policy are counted in `dropped` (or `coalesced`),
+    and `max_depth` records the highest depth seen, so an overloaded consumer
+    shows up in the numbers instead of as silently missing data.
+    """
+    POLICIES = ("block", "drop-oldest", "drop-newest", "coalesce-latest")
+
+    def __init__(self, maxsize=1024, policy="drop-oldest"):
+        if policy not in self.POLICIES:
+            raise ValueError("Unknown queue policy '{}'; expected one of {}".format(policy, ", ".join(self.POLICIES)))
+        self.maxsize = maxsize
+        self.policy = policy
+        # (key, item) pairs, or {key: item} when coalescing (dicts keep insertion order)
+        self.items = {} if policy == "coalesce-latest" else deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.put_count = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def put(self, key, item):
+        """
+        Queues an item from the source `key`, applying the policy if the queue is full.
+        """
+        with self.condition:
+            self.put_count += 1
+            if self.policy == "coalesce-latest":
+                if key in self.items:
+                    self.coalesced += 1
+                    self.items[key] = item
+                    return
+                if len(self.items) >= self.maxsize:
+                    self.dropped += 1
+                    return
+                self.items[key] = item
+            else:
+                if len(self.items) >= self.maxsize:
+                    if self.policy == "drop-newest":
+                        self.dropped += 1
+                        return
+                    if self.policy == "drop-oldest":
+                        self.items.popleft()
+                        self.dropped += 1
+                    else:
+                        while len(self.items) >= self.maxsize and not self.closed:
+                            self.condition.wait()
+                self.items.append((key, item))
+            self.max_depth = max(self.max_depth, len(self.items))
+            self.condition.notify()
+
+    def get(self):
+        """
+        Returns the oldest (key, item), waiting for one if the queue is empty,
+        or None once the queue is closed and empty.
+        """
+        with self.condition:
+            while not self.items:
+                if self.closed:
+                    return None
+                self.condition.wait()
+            if self.policy == "coalesce-latest":
+                key = next(iter(self.items))
+                entry = key, self.items.pop(key)
+            else:
+                entry = self.items.popleft()
+            self.condition.notify()
+            return entry
+
+    def close(self):
+        """
+        Wakes up both threads; get returns what is left, then None.
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def stats(self):
+        return {
+            "policy": self.policy,
+            "depth": len(self.items),
+            "max_depth": self.max_depth,
+            "maxsize": self.maxsize,
+            "packets": self.put_count,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
+
 
 class UDPClient:
-    def __init__(self, listen_ip='0.0.0.0', listen_port=5005, buffer_size=1024):
+    def __init__(self, listen_ip='0.0.0.0', listen_port=5005, buffer_size=65535, receive_buffer=1 << 20,
+                 source_key=None):
+        """
+        :param listen_ip: Local IP to bind the listener (default: all interfaces)
+        :param listen_port: Local port to listen on. Any number of Picos can send
+            to this one port; their packets are told apart by source_key.
+        :param buffer_size: Largest datagram to receive, in bytes. Longer ones are
+            cut off, so the default is the largest UDP payload; a Kalman frame
+            of 50 samples per array is already 1008 bytes.
+        :param receive_buffer: Requested size of the socket's kernel receive
+            buffer, so bursts from many robots are queued instead of dropped.
+        :param source_key: Function (data, addr) -> key naming the robot a packet
+            came from. The default is the sender's IP address, addr[0]; use e.g.
+            lambda data, addr: data[0] if each robot puts an ID byte first.
+        """
         self.listen_ip = listen_ip
         self.listen_port = listen_port
         self.buffer_size = buffer_size
+        self.source_key = source_key
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer)
         self.sock.bind((self.listen_ip, self.listen_port))
         self.running = False
+        self.queue = None
+        # Per-source handlers and counters, keyed by source_key
+        self.handlers = {}
+        self.sources = {}
 
-    def start(self, callback):
+    def add_handler(self, source, callback):
         """
-        Start receiving data. The callback is called with each received message (as bytes).
+        Sends the packets from one source to their own callback(data, addr),
+        e.g. the process_bytes of a DataLogger for that robot. Can be called
+        while receiving.
+        """
+        self.handlers[source] = callback
+
+    def start(self, callback=None, handler_factory=None, queue_size=1024, policy="drop-oldest"):
+        """
+        Start receiving data. Each received message (as bytes) is passed with
+        its sender's address to the handler added for its source, or to
+        callback if there is none.
+
+        The receive thread only reads the socket and puts the packets in a
+        HandoffQueue; a second thread takes them out and runs the handlers, so
+        a slow handler makes the queue fill up (see policy) instead of the
+        kernel's socket buffer, where packets would be lost without a trace.
+
+        :param callback: Default callback(data, addr) for sources without a handler.
+        :param handler_factory: Optional function called with the key of each new
+            source without a handler, returning the handler for it. Lets one
+            client give every robot of a fleet its own logger as it shows up.
+            If it raises, the error is counted for that source, which then
+            uses callback.
+        :param queue_size: Most packets waiting for the handlers. 0 runs the
+            handlers on the receive thread itself, without a queue.
+        :param policy: What to do when the queue is full: "block",
+            "drop-oldest", "drop-newest" or "coalesce-latest" (see HandoffQueue).
         """
         self.running = True
+        if queue_size:
+            self.queue = HandoffQueue(queue_size, policy)
+
+        def handle(key, handler, data, addr):
+            try:
+                handler(data, addr)
+            except Exception as e:
+                # Keep receiving the other robots' packets
+                self.sources[key].errors += 1
+                print("Warning: Handler for source {} failed: {!r}; discarding packet.".format(key, e))
+
+        def consume():
+            while True:
+                entry = self.queue.get()
+                if entry is None:
+                    break
+                key, (handler, data, addr) = entry
+                handle(key, handler, data, addr)
+
         def listen():
+            sources = self.sources
+            handlers = self.handlers
+            queue = self.queue
             while self.running:
-                data, addr = self.sock.recvfrom(self.buffer_size)
-                callback(data, addr)
+                try:
+                    data, addr = self.sock.recvfrom(self.buffer_size)
+                except OSError:
+                    break  # socket closed by stop()
+                now = time.perf_counter()
+                key = addr[0] if self.source_key is None else self.source_key(data, addr)
+                counters = sources.get(key)
+                if counters is None:
+                    counters = sources[key] = SourceCounters(now)
+                    if handler_factory is not None and key not in handlers:
+                        try:
+                            handlers[key] = handler_factory(key)
+                        except Exception as e:
+                            # Keep receiving; this source's packets go to callback
+                            counters.errors += 1
+                            print("Warning: Handler factory failed for source {}: {!r}; using the default callback.".format(key, e))
+                counters.packets += 1
+                counters.bytes += len(data)
+                counters.last_seen = now
+                handler = handlers.get(key, callback)
+                if handler is None:
+                    counters.unhandled += 1
+                    continue
+                if queue is None:
+                    handle(key, handler, data, addr)
+                else:
+                    queue.put(key, (handler, data, addr))
+            if queue is not None:
+                queue.close()
+        if self.queue is not None:
+            threading.Thread(target=consume, daemon=True).start()
         thread = threading.Thread(target=listen, daemon=True)
         thread.start()
 
+    def source_stats(self):
+        """
+        Returns a dictionary of packet counters for every source seen so far.
+        """
+        return {key: counters.summary() for key, counters in list(self.sources.items())}
+
+    def queue_stats(self):
+        """
+        Returns the handoff queue's depth and drop counters, or None without a queue.
+        """
+        return None if self.queue is None else self.queue.stats()
+
     def stop(self):
         self.running = False
         self.sock.close()
+        if self.queue is not None:
+            # Lets a receive thread blocked on a full queue finish
+            self.queue.close()
+
+# Example of one laptop process collecting data from a whole lab of robots:
+# from data_logger import DataLogger
+# from frame_decoder import FrameDecoder
+#
+# decoder = FrameDecoder()
+# decoder.register_schema(1, ["TIME", "ENCODER_YAW", "IMU_YAW", "KALMAN", "ESTIMATE_COVARIANCE"])
+# loggers = {}
+# def new_robot(ip):
+#     logger = loggers[ip] = DataLogger()
+#     def on_frame(data, addr):
+#         frame = decoder.decode(data)
+#         if frame is not None:
+#             logger.process_dict(frame.to_dict())
+#     return on_frame
+#
+# client = UDPClient(listen_port=5005)
+# client.start(handler_factory=new_robot)
+# ...
+# print(client.source_stats(), client.queue_stats())
+# for ip, logger in loggers.items():
+#     logger.save_to_csv("robot_{}.csv".format(ip.replace(".", "_")))
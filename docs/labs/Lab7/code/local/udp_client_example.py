@@ -1,49 +1,111 @@
+import time
+import numpy as np
 from udp_client import UDPClient
-import struct
 from data_logger import DataLogger
+from frame_decoder import FrameDecoder
+
+# The Pico sends its arrays as frames (see frame_encoder.py) whose header holds
+# the schema ID, number of arrays, samples per array and sample type, so the
+# array size does not have to match anything here. The schema ID only picks
+# the channel names; update them if you change the arrays sent in the Pico code.
+KALMAN_SCHEMA = 1  # This should match the schema ID used in the Pico code
+CHANNELS = ["TIME", "ENCODER_YAW", "IMU_YAW", "KALMAN", "ESTIMATE_COVARIANCE"]
 
 data_logger = DataLogger()
+decoder = FrameDecoder()
+decoder.register_schema(KALMAN_SCHEMA, CHANNELS)
 
-def print_message(data, addr):
 
-    global data_logger
-
-    # Define the expected array size
-    ARRAY_SIZE = 50  # This should match the size used in the Pico code
-
-    # Calculate expected data length (5 arrays of floats, each float is 4 bytes)
-    # Be sure to update this if you change the ARRAY_SIZE or the number of arrays in the Pico code
-    expected_length = 5 * ARRAY_SIZE * 4
-
-    # Check if received data has the expected length
-    if len(data) == expected_length:
-        floats = struct.unpack('<%df' % (5 * ARRAY_SIZE), data)
-        # Split into arrays
-        time_data = floats[0:ARRAY_SIZE]
-        encoder_yaw_data = floats[ARRAY_SIZE:2*ARRAY_SIZE]
-        imu_yaw_data = floats[2*ARRAY_SIZE:3*ARRAY_SIZE]
-        kalman_data = floats[3*ARRAY_SIZE:4*ARRAY_SIZE]
-        estimate_covarience = floats[4*ARRAY_SIZE:5*ARRAY_SIZE]
-        # Now you can use these arrays as needed
-        print("Received data:", len(data), " bytes")
-
-        data_dict = {
-            "TIME": time_data,
-            "ENCODER_YAW": encoder_yaw_data,
-            "IMU_YAW": imu_yaw_data,
-            "KALMAN": kalman_data,
-            "ESTIMATE_COVARIANCE": estimate_covarience
-        }
-
-        data_logger.process_dict(data_dict)
-
-        #for t, ey, iy, k, ec in zip(time_data, encoder_yaw_data, imu_yaw_data, kalman_data, estimate_covarience):
-        #    # Log the data using the DataLogger
-        #    data_logger.process_string(f"TIME:{int(1000*t)}, ENC:{ey}, IMU:{iy}, KALMAN:{k}, ESTCOV:{ec}")
-
-    else:
-        print(f"Warning: Received data length ({len(data)} bytes) doesn't match expected length ({expected_length} bytes)")
+class PacketRing:
+    """
+    Preallocated ring of (channels, samples) blocks that received frames are
+    copied into.
+
+    push copies a decoded frame (a view of the datagram) into the next block,
+    so receiving a packet costs one memcpy and creates no Python floats,
+    tuples or dicts. The receive thread only pushes; the main thread
+    moves everything pushed so far into the DataLogger in one vectorized call
+    with drain_to. If the main thread falls more than `capacity` packets
+    behind, the oldest packets are overwritten and counted in `overwritten`.
+    """
+    def __init__(self, channels, samples, dtype=np.float32, capacity=1024):
+        """
+        :param channels: Channel names, one per row of a block.
+        :param samples: Samples per channel in a block.
+        """
+        self.channels = channels
+        self.blocks = np.empty((capacity, len(channels), samples), dtype=dtype)
+        self.capacity = capacity
+        self.pushed = 0   # packets pushed so far (only the receive thread writes it)
+        self.drained = 0  # packets drained so far (only the main thread writes it)
+        self.overwritten = 0
+
+    def push(self, block):
+        """
+        Copies one (channels, samples) block into the ring.
+        """
+        self.blocks[self.pushed % self.capacity] = block
+        self.pushed += 1
+
+    def latest(self):
+        """
+        Returns a copy of the most recently pushed block, or None.
+        """
+        if self.pushed == 0:
+            return None
+        return self.blocks[(self.pushed - 1) % self.capacity].copy()
+
+    def drain(self):
+        """
+        Returns the blocks pushed since the last drain, oldest first, as one
+        (n, channels, samples) array.
+        """
+        pushed = self.pushed
+        start = max(self.drained, pushed - self.capacity)
+        self.overwritten += start - self.drained
+        indices = np.arange(start, pushed) % self.capacity
+        blocks = self.blocks[indices]
+        # Blocks the receive thread overwrote while they were being copied
+        # are dropped rather than returned torn
+        lapped = max(0, self.pushed - self.capacity - start)
+        self.overwritten += min(lapped, len(blocks))
+        self.drained = pushed
+        return blocks[lapped:]
+
+    def drain_to(self, data_logger):
+        """
+        Moves the blocks pushed since the last drain into a DataLogger.
+        """
+        blocks = self.drain()
+        if len(blocks):
+            data_logger.process_dict({name: blocks[:, i].reshape(-1) for i, name in enumerate(self.channels)})
+
+
+# One ring per kind of frame, created when the first frame of that kind arrives
+rings = {}
+
+def print_message(data, addr):
+    # Only decode the header and copy the samples here, so the receive thread is
+    # back on the socket right away; the main loop below hands the data to the
+    # logger in batches.
+    frame = decoder.decode(data)
+    if frame is None:
         return
+    key = (frame.schema_id, frame.values.shape, frame.values.dtype.str)
+    ring = rings.get(key)
+    if ring is None:
+        ring = rings[key] = PacketRing(frame.names, frame.values.shape[1], frame.values.dtype)
+    ring.push(frame.values)
+
+def drain_rings():
+    """
+    Moves everything received so far into the data logger; returns the number of packets.
+    """
+    received = 0
+    for ring in list(rings.values()):
+        received += ring.pushed - ring.drained
+        ring.drain_to(data_logger)
+    return received
 
 if __name__ == "__main__":
     client = UDPClient(listen_port=5005)
@@ -51,8 +113,12 @@ if __name__ == "__main__":
     client.start(print_message)
     try:
         while True:
-            pass  # Keep the main thread alive
+            time.sleep(0.1)
+            received = drain_rings()
+            if received:
+                print("Received", received, "packets")
     except KeyboardInterrupt:
         print("\nStopping UDP client.")
-        data_logger.save_to_csv("sensor_data.csv")  
+        drain_rings()
+        data_logger.save_to_csv("sensor_data.csv")
         client.stop()
@@ -0,0 +1,49 @@
+import struct
+
+# Telemetry frame layout (little-endian), decoded on the laptop by frame_decoder.py:
+#     2s  magic b"TF"
+#     B   format version
+#     B   schema ID       tells the laptop which channel names to use
+#     B   typecode        array typecode of the samples, e.g. ord('f')
+#     B   channel count
+#     H   samples per channel
+# followed by the channels' samples, one channel after the other. The header
+# is 8 bytes, so float32 samples stay 4-byte aligned.
+FRAME_MAGIC = b"TF"
+FRAME_VERSION = 1
+HEADER_FORMAT = "<2sBBBBH"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+
+class FrameEncoder:
+    def __init__(self, schema_id, channels, samples, typecode='f'):
+        """
+        Packs arrays into self-describing telemetry frames, reusing one buffer.
+
+        :param schema_id: Number (0-255) identifying what the channels are; the
+            laptop maps it to channel names. Channel 0 should be the time.
+        :param channels: Number of arrays in each frame.
+        :param samples: Number of samples in each array.
+        :param typecode: Array typecode of the samples ('f' for float, 'h', 'i', ...)
+        """
+        self.channels = channels
+        self.samples = samples
+        self.channel_size = struct.calcsize(typecode) * samples
+        self.buffer = bytearray(HEADER_SIZE + channels * self.channel_size)
+        struct.pack_into(HEADER_FORMAT, self.buffer, 0, FRAME_MAGIC, FRAME_VERSION,
+                         schema_id, ord(typecode), channels, samples)
+
+    def encode(self, arrays):
+        """
+        Copies the arrays (array.array of the encoder's typecode, one per
+        channel) into the frame and returns it, ready for UDPServer.send.
+        The returned buffer is reused by the next call.
+        """
+        if len(arrays) != self.channels:
+            raise ValueError("Expected {} arrays, got {}".format(self.channels, len(arrays)))
+        offset = HEADER_SIZE
+        for data in arrays:
+            # The Pico is little-endian, so the array's memory is the wire format
+            self.buffer[offset:offset + self.channel_size] = bytes(data)
+            offset += self.channel_size
+        return self.buffer
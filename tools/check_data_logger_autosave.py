@@ -0,0 +1,77 @@
+"""
+Checks that each lab's DataLogger still saves its data when the interpreter
+exits, which the lab scripts rely on: they create the logger at module level
+(or in main) and let __del__ write data_logger.csv at shutdown.
+
+For every lab a fresh interpreter logs a few samples into a module-level
+DataLogger and exits; the check fails unless the CSV it leaves behind holds
+those rows. Exits with status 1 on failure.
+
+Usage:
+    python tools/check_data_logger_autosave.py
+    python tools/check_data_logger_autosave.py --labs Lab5
+"""
+import argparse
+import csv
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = """
+import sys
+sys.path.insert(0, {local!r})
+from data_logger import DataLogger
+
+logger = DataLogger()
+logger.process_string("A:1, TIME:1")
+logger.process_string("A:2.5, TIME:2")
+logger.process_dict({{"TIME": [3, 4], "B": [5, 6]}})
+"""
+
+# process_dict also logs TIME as a sensor, hence the second TIME column
+EXPECTED = [["TIME", "A", "B", "TIME"], ["1", "1", "", ""], ["2", "2.5", "", ""], ["3", "", "5", "3"],
+            ["4", "", "6", "4"]]
+
+
+def check(lab):
+    """
+    Returns None if the lab's logger saved the expected rows at exit, or a
+    description of what went wrong.
+    """
+    local = os.path.join(ROOT, "docs", "labs", lab, "code", "local")
+    with tempfile.TemporaryDirectory(prefix="autosave_check_") as directory:
+        result = subprocess.run([sys.executable, "-c", SCRIPT.format(local=local)], cwd=directory,
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            return "interpreter failed:\n" + result.stderr
+        path = os.path.join(directory, "data_logger.csv")
+        if not os.path.exists(path):
+            return "no data_logger.csv written; output:\n" + result.stdout
+        with open(path, newline="") as f:
+            rows = list(csv.reader(f))
+        if rows != EXPECTED:
+            return "data_logger.csv holds {!r}, expected {!r}; output:\n{}".format(rows, EXPECTED, result.stdout)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--labs", nargs="+", default=["Lab3", "Lab5", "Lab7"], help="Lab folders to check")
+    args = parser.parse_args()
+
+    failed = False
+    for lab in args.labs:
+        problem = check(lab)
+        if problem is None:
+            print("{}: ok".format(lab))
+        else:
+            failed = True
+            print("{}: FAILED, {}".format(lab, problem))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
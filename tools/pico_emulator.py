@@ -0,0 +1,301 @@
+"""
+Impersonates one or many Picos, so the laptop side of the labs (UDPClient,
+TCPClient, DataLogger, LivePlotter) can be load tested without WiFi or robots.
+
+Modes:
+    lab3  UDP string telemetry, "TIME:<ms>,PROX:<v>,INTENSE:<v>,RANGE:<v>",
+          sent to the laptop's UDPClient; commands sent to the emulated Pico
+          are answered with "ACK: <command>" like UDPServer.listen does.
+    lab5  UDP packets of 5 float32 arrays (TIME, ENCODER_YAW, IMU_YAW, KALMAN,
+          ESTIMATE_COVARIANCE) like kalman_filter.py sends, as self-describing
+          frames (--raw for bare arrays). Also used by Lab7.
+    lab2  A TCP server per Pico sending "Sensor data: (roll, pitch, yaw)"
+          lines to the TCPClient that connects, like test_tcp_server.py.
+
+Usage:
+    python tools/pico_emulator.py lab3 --rate 100 --command-port 12346
+    python tools/pico_emulator.py lab5 --picos 15 --rate 50 --duration 30
+    python tools/pico_emulator.py lab5 --rate 5000 --array-size 100 --header
+    python tools/pico_emulator.py lab2 --rate 20
+
+With several Picos on the loopback interface each one gets its own address,
+127.0.0.2, 127.0.0.3, ... (Linux routes all of 127/8 to loopback), so they look
+like separate robots to UDPClient, and for lab2 each runs its own server.
+For any other --host they all bind every interface, so instead Pico i listens
+on --command-port + i (lab3) or serves TCP on --port + i (lab2).
+Packets are sent on an absolute schedule; when the event loop wakes up late
+it sends every packet that is due, so high rates are reached in bursts
+instead of drifting. On exit (--duration or Ctrl+C) a JSON summary per Pico
+is printed: packets sent, achieved rate, send errors and commands answered.
+
+In lab3 the laptop's UDPClient and the emulator both bind UDP ports on the
+same machine, so the emulated Picos listen for commands on --command-port
+(default 12346); create the client with remote_ip set to the emulated
+Pico's address and remote_port=12346. Their TIME stamps are whole ms like
+the Pico's time.ticks_ms(), but each is at least 1 ms after the previous one,
+so above 1000 messages a second the stamps run ahead of the clock rather
+than repeat (the DataLogger would discard repeated ones).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "docs", "labs", "Lab5", "code", "local"))
+from frame_decoder import encode_frame  # noqa: E402
+from stream_stats import HEADER, TICKS_PERIOD  # noqa: E402
+
+LAB3_NAMES = ["PROX", "INTENSE", "RANGE"]
+KALMAN_SCHEMA = 1
+KALMAN_CHANNELS = 5
+
+
+def pico_address(host, index):
+    """
+    Local address for the index-th emulated Pico: a loopback address of its
+    own when talking to a loopback host, otherwise any interface.
+    """
+    if host.startswith("127."):
+        return "127.0.0.{}".format(index + 2)
+    return "0.0.0.0"
+
+
+def pico_port(host, port, index):
+    """
+    Port the index-th emulated Pico listens on: the given one when it has a
+    loopback address of its own, otherwise one per Pico starting from it.
+    """
+    if host.startswith("127."):
+        return port
+    return port + index
+
+
+def ticks_us():
+    return (time.perf_counter_ns() // 1000) % TICKS_PERIOD
+
+
+class EmulatedPico:
+    """
+    Generates one Pico's telemetry and keeps its counters.
+    """
+    def __init__(self, index, args):
+        self.index = index
+        self.args = args
+        self.address = pico_address(args.host, index)
+        if args.mode == "lab3":
+            self.port = pico_port(args.host, args.command_port, index)
+        elif args.mode == "lab2":
+            self.port = pico_port(args.host, args.port, index)
+        else:
+            self.port = 0  # any free port; lab5 Picos only send
+        self.sequence = 0
+        self.sent = 0
+        self.bytes = 0
+        self.errors = 0
+        self.commands = 0
+        self.started = None
+        self.rng = random.Random(args.seed + index)
+        self.np_rng = np.random.default_rng(args.seed + index)
+        self.values = [0.0] * max(args.channels, KALMAN_CHANNELS)
+        self.start_ms = time.monotonic() * 1000
+        self.last_ms = -1
+
+    def walk(self, n):
+        for i in range(n):
+            self.values[i] += self.rng.gauss(0, 0.1)
+        return self.values[:n]
+
+    def lab3_message(self):
+        names = (LAB3_NAMES + ["CH{}".format(i) for i in range(3, self.args.channels)])[:self.args.channels]
+        self.last_ms = max(int(time.monotonic() * 1000 - self.start_ms), self.last_ms + 1)
+        fields = ["TIME:{}".format(self.last_ms)]
+        fields += ["{}:{:.4f}".format(name, value) for name, value in zip(names, self.walk(len(names)))]
+        message = ",".join(fields)
+        if self.args.header:
+            message = "SEQ:{},TICKS:{},{}".format(self.sequence, ticks_us(), message)
+            self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        return message.encode("utf-8")
+
+    def lab5_packet(self):
+        size = self.args.array_size
+        now = time.monotonic() - self.start_ms / 1000
+        period = 1 / (self.args.rate * size)
+        arrays = np.empty((KALMAN_CHANNELS, size), dtype="<f4")
+        arrays[0] = now - period * np.arange(size)[::-1]
+        arrays[1:] = np.asarray(self.walk(KALMAN_CHANNELS - 1))[:, None] + \
+            np.cumsum(self.np_rng.normal(0, 0.01, (KALMAN_CHANNELS - 1, size)), axis=1)
+        data = arrays.tobytes() if self.args.raw else encode_frame(KALMAN_SCHEMA, arrays)
+        if self.args.header:
+            data = HEADER.pack(self.sequence, ticks_us()) + data
+            self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        return data
+
+    def lab2_line(self):
+        roll, pitch, yaw = self.walk(3)
+        return "Sensor data: ({}, {}, {})\n".format(roll, pitch, yaw).encode()
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started if self.started else 0.0
+        return {
+            "pico": self.index,
+            "address": self.address,
+            "port": self.port,
+            "sent": self.sent,
+            "bytes": self.bytes,
+            "send_errors": self.errors,
+            "commands_answered": self.commands,
+            "packets_per_second": self.sent / elapsed if elapsed > 0 else 0.0,
+        }
+
+
+async def paced(pico, rate, send):
+    """
+    Calls send() rate times a second on an absolute schedule, catching up in
+    bursts when the event loop wakes up late. send may be a coroutine
+    function; it is then awaited, so it can wait for a slow receiver.
+    """
+    period = 1 / rate
+    is_async = asyncio.iscoroutinefunction(send)
+    pico.started = start = time.perf_counter()
+    due = 0
+    while True:
+        now = time.perf_counter()
+        while due * period <= now - start:
+            if is_async:
+                await send()
+            else:
+                send()
+            due += 1
+        await asyncio.sleep(max(0.0, start + due * period - time.perf_counter()))
+
+
+class _CommandProtocol(asyncio.DatagramProtocol):
+    """
+    Answers commands sent to an emulated Lab3 Pico like UDPServer.listen.
+    """
+    def __init__(self, pico, laptop):
+        self.pico = pico
+        self.laptop = laptop
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        # UDPServer sends the ACK to the laptop's listening port, not the sender's
+        self.pico.commands += 1
+        self.transport.sendto(b"ACK: " + data, (addr[0], self.laptop[1]))
+
+    def error_received(self, exc):
+        self.pico.errors += 1
+
+
+async def run_udp(pico, args):
+    loop = asyncio.get_running_loop()
+    laptop = (args.host, args.port)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20)
+    sock.bind((pico.address, pico.port))
+    transport, _ = await loop.create_datagram_endpoint(lambda: _CommandProtocol(pico, laptop), sock=sock)
+    make = pico.lab3_message if args.mode == "lab3" else pico.lab5_packet
+
+    def send():
+        data = make()
+        try:
+            sock.sendto(data, laptop)
+            pico.sent += 1
+            pico.bytes += len(data)
+        except OSError:
+            # Socket buffer full or laptop port closed; the real Pico would lose it too
+            pico.errors += 1
+    try:
+        await paced(pico, args.rate, send)
+    finally:
+        transport.close()
+
+
+async def run_tcp(pico, args):
+    async def handle_client(reader, writer):
+        async def read_commands():
+            while await reader.readline():
+                pico.commands += 1
+        commands = asyncio.create_task(read_commands())
+
+        async def send():
+            if writer.is_closing():
+                raise ConnectionResetError("client disconnected")
+            line = pico.lab2_line()
+            writer.write(line)
+            # Wait while the client is not keeping up, like the Pico's tcp_server.py
+            await writer.drain()
+            pico.sent += 1
+            pico.bytes += len(line)
+        try:
+            await paced(pico, args.rate, send)
+        except (ConnectionError, OSError):
+            pico.errors += 1
+        except asyncio.CancelledError:
+            pass  # --duration ran out or Ctrl+C
+        finally:
+            commands.cancel()
+            writer.close()
+
+    server = await asyncio.start_server(handle_client, pico.address, pico.port)
+    print("Emulated Pico {} waiting for a TCP client on {}:{}".format(pico.index, pico.address, pico.port),
+          file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+
+async def main_async(picos, args):
+    run = run_tcp if args.mode == "lab2" else run_udp
+    tasks = [asyncio.create_task(run(pico, args)) for pico in picos]
+    try:
+        await asyncio.wait_for(asyncio.gather(*tasks), args.duration)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", choices=["lab2", "lab3", "lab5"])
+    parser.add_argument("--picos", type=int, default=1, help="Number of Picos to emulate")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="Laptop address; for lab2 a loopback address serves each Pico on its own address")
+    parser.add_argument("--port", type=int,
+                        help="Laptop UDP port (default 12345 for lab3, 5005 for lab5) or TCP server port for lab2 (1234)")
+    parser.add_argument("--command-port", type=int, default=12346, help="UDP port the lab3 Picos take commands on")
+    parser.add_argument("--rate", type=float, help="Messages per second per Pico (default 10 lab3, 20 lab5, 2 lab2)")
+    parser.add_argument("--channels", type=int, default=3, help="Sensor values per lab3 message")
+    parser.add_argument("--array-size", type=int, default=50, help="Samples per array in a lab5 packet")
+    parser.add_argument("--raw", action="store_true", help="lab5: send bare arrays without the frame header")
+    parser.add_argument("--header", action="store_true",
+                        help="Add the sequence number/ticks header of UDPServer(header=True)")
+    parser.add_argument("--duration", type=float, help="Seconds to run (default: until Ctrl+C)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.port is None:
+        args.port = {"lab2": 1234, "lab3": 12345, "lab5": 5005}[args.mode]
+    if args.rate is None:
+        args.rate = {"lab2": 2, "lab3": 10, "lab5": 20}[args.mode]
+
+    picos = [EmulatedPico(i, args) for i in range(args.picos)]
+    try:
+        asyncio.run(main_async(picos, args))
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps({"mode": args.mode, "rate": args.rate, "picos": [pico.summary() for pico in picos]}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
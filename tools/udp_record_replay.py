@@ -0,0 +1,210 @@
+"""
+Records UDP telemetry to a file and replays it, so the laptop pipeline
+(UDPClient, DataLogger, plotter) can be load tested without a robot.
+
+Recording writes every datagram received on a port with its arrival time
+and source address:
+    python tools/udp_record_replay.py record --port 5005 -o run.udprec
+(stop with Ctrl+C). Replaying sends the datagrams to a UDPClient again, at the
+original speed, N times faster, or as fast as possible:
+    python tools/udp_record_replay.py replay run.udprec --port 5005
+    python tools/udp_record_replay.py replay run.udprec --port 5005 --speed 10
+    python tools/udp_record_replay.py replay run.udprec --port 5005 --speed 0
+With --split-sources every original sender gets its own socket on a separate
+loopback address (127.0.0.2, 127.0.0.3, ...; Linux routes all of 127/8 to
+loopback), so a fleet recording still looks like several robots to UDPClient.
+A summary of the replay (achieved rate, how far sends fell behind schedule)
+is printed as JSON.
+
+The recorder is also usable from Python, e.g. as a UDPClient callback that
+records while the normal pipeline runs:
+    recorder = DatagramRecorder("run.udprec")
+    client.start(lambda data, addr: (recorder(data, addr), data_logger.process_bytes(data)))
+
+File format (little-endian): the 8 byte magic b"UDPREC\\x00\\x01", the float64
+time.time() the recording started, then one record per datagram: float64
+seconds since the start, 4 byte IPv4 address, uint16 port, uint16 length,
+and the datagram itself.
+"""
+import argparse
+import json
+import socket
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+
+MAGIC = b"UDPREC\x00\x01"
+START = struct.Struct("<d")
+RECORD = struct.Struct("<d4sHH")
+
+
+class DatagramRecorder:
+    """
+    Appends datagrams to a recording file. Calling the recorder with
+    (data, addr) records one datagram, so it can be used as a callback.
+    """
+    def __init__(self, filename):
+        self.file = open(filename, "wb")
+        self.start = time.time()
+        self.start_clock = time.perf_counter()
+        self.file.write(MAGIC + START.pack(self.start))
+        self.count = 0
+        self.bytes = 0
+        # Callbacks may run on a receive thread while the main thread closes
+        self.lock = threading.Lock()
+
+    def __call__(self, data, addr, arrival=None):
+        """
+        :param arrival: time.perf_counter() when the datagram arrived (default: now).
+        """
+        if arrival is None:
+            arrival = time.perf_counter()
+        record = RECORD.pack(arrival - self.start_clock, socket.inet_aton(addr[0]), addr[1], len(data))
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.write(record)
+            self.file.write(data)
+            self.count += 1
+            self.bytes += len(data)
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_recording(filename):
+    """
+    Returns (start time, [(seconds since start, (ip, port), data), ...]) for a recording.
+    A record cut off at the end (e.g. by a crash while recording) is skipped.
+    """
+    with open(filename, "rb") as f:
+        content = f.read()
+    if not content.startswith(MAGIC):
+        raise ValueError("{} is not a UDP recording".format(filename))
+    (start,) = START.unpack_from(content, len(MAGIC))
+    offset = len(MAGIC) + START.size
+    records = []
+    while offset + RECORD.size <= len(content):
+        t, ip, port, length = RECORD.unpack_from(content, offset)
+        offset += RECORD.size
+        if offset + length > len(content):
+            print("Warning: Recording ends in the middle of a datagram; skipping it.", file=sys.stderr)
+            break
+        records.append((t, (socket.inet_ntoa(ip), port), content[offset:offset + length]))
+        offset += length
+    return start, records
+
+
+def record(args):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+    sock.bind((args.ip, args.port))
+    sock.settimeout(0.5)
+    print("Recording UDP datagrams on {}:{} to {} (Ctrl+C to stop)...".format(args.ip, args.port, args.output),
+          file=sys.stderr)
+    with DatagramRecorder(args.output) as recorder:
+        end = time.perf_counter() + args.duration if args.duration else None
+        try:
+            while end is None or time.perf_counter() < end:
+                try:
+                    data, addr = sock.recvfrom(65535)
+                except socket.timeout:
+                    continue
+                recorder(data, addr)
+        except KeyboardInterrupt:
+            pass
+        print("Recorded {} datagrams ({} bytes).".format(recorder.count, recorder.bytes), file=sys.stderr)
+    sock.close()
+
+
+def replay(args):
+    _, records = read_recording(args.recording)
+    if not records:
+        print("Warning: {} holds no datagrams.".format(args.recording), file=sys.stderr)
+        return
+    target = (args.host, args.port)
+
+    sockets = {}
+    default = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if args.split_sources:
+        for i, source in enumerate(sorted({addr for _, addr, _ in records})):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind(("127.0.0.{}".format(i + 2), 0))
+            sockets[source] = sock
+
+    lateness = np.empty(len(records) * args.loops)
+    first = records[0][0]
+    sent = 0
+    start = time.perf_counter()
+    for loop in range(args.loops):
+        loop_start = time.perf_counter()
+        for t, addr, data in records:
+            if args.speed > 0:
+                due = loop_start + (t - first) / args.speed
+                wait = due - time.perf_counter()
+                if wait > 0.002:
+                    time.sleep(wait - 0.001)
+                while time.perf_counter() < due:
+                    pass
+                lateness[sent] = time.perf_counter() - due
+            else:
+                lateness[sent] = 0.0
+            sockets.get(addr, default).sendto(data, target)
+            sent += 1
+    elapsed = time.perf_counter() - start
+
+    recorded = records[-1][0] - first
+    print(json.dumps({
+        "recording": args.recording,
+        "datagrams": sent,
+        "sources": len({addr for _, addr, _ in records}),
+        "speed": args.speed if args.speed > 0 else "max",
+        "recorded_seconds": recorded * args.loops,
+        "replay_seconds": elapsed,
+        "datagrams_per_second": sent / elapsed if elapsed > 0 else None,
+        "p99_behind_schedule_ms": float(np.percentile(lateness, 99) * 1000),
+        "max_behind_schedule_ms": float(lateness.max() * 1000),
+    }, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    parser_record = commands.add_parser("record", help="Record the datagrams received on a port")
+    parser_record.add_argument("--ip", default="0.0.0.0", help="Local IP to listen on")
+    parser_record.add_argument("--port", type=int, default=5005, help="Port to listen on")
+    parser_record.add_argument("--duration", type=float, help="Stop after this many seconds")
+    parser_record.add_argument("-o", "--output", default="telemetry.udprec")
+
+    parser_replay = commands.add_parser("replay", help="Send a recording to a UDPClient")
+    parser_replay.add_argument("recording")
+    parser_replay.add_argument("--host", default="127.0.0.1", help="Address the UDPClient listens on")
+    parser_replay.add_argument("--port", type=int, default=5005, help="Port the UDPClient listens on")
+    parser_replay.add_argument("--speed", type=float, default=1.0,
+                               help="Replay speed relative to the recording; 0 sends as fast as possible")
+    parser_replay.add_argument("--loops", type=int, default=1, help="Replay the recording this many times")
+    parser_replay.add_argument("--split-sources", action="store_true",
+                               help="Send each original source's datagrams from its own loopback address")
+
+    args = parser.parse_args()
+    if args.command == "record":
+        record(args)
+    else:
+        replay(args)
+
+
+if __name__ == "__main__":
+    main()